@@ -1,100 +1,268 @@
 # ai_prompter.py
-import openai
+import asyncio
+import logging
 import os
-from typing import Dict, Any
+from dataclasses import dataclass
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+from openai_client import get_openai_client, REPORT_MODEL, REPORT_MAX_TOKENS, REPORT_TEMPERATURE
+from report_cache import get_report_cache, report_cache_key
+from metrics import PROMPT_TOKENS, stage
 
-def generate_vibe_report(analysis_data: Dict[str, Any]) -> str:
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = "You are a music expert and cultural analyst known for your engaging and witty personality profiles based on music taste."
+
+NO_KEY_MESSAGE = "AI analysis unavailable - OpenAI API key not configured. Your quantitative data is ready!"
+
+# Estimated tokens for the user prompt; more budget means more sample tracks
+# and artists in the prompt, at the cost of LLM latency and spend
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "400"))
+CHARS_PER_TOKEN = 4
+
+def build_report_messages(analysis_data: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Chat messages for the vibe report, within PROMPT_TOKEN_BUDGET"""
+    with stage("prompt_build"):
+        prompt, usage = build_analysis_prompt(analysis_data)
+    prompt_tokens = usage["prompt_tokens"] + estimate_tokens(SYSTEM_PROMPT)
+    PROMPT_TOKENS.observe(prompt_tokens)
+    logger.debug("🔍 Prompt: ~%d tokens (%s)", prompt_tokens, usage)
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+@dataclass
+class ReportOutcome:
+    """Filled in by stream_vibe_report: `ok` is False once a fallback message was sent instead of a report"""
+    ok: bool = True
+
+def report_key(messages: List[Dict[str, str]]) -> str:
+    """Report cache key for these messages under the current model parameters"""
+    return report_cache_key(messages, model=REPORT_MODEL, max_tokens=REPORT_MAX_TOKENS,
+                            temperature=REPORT_TEMPERATURE)
+
+async def generate_vibe_report(analysis_data: Dict[str, Any]) -> Tuple[str, bool]:
     """
-    Generate an AI-powered vibe report from the analyzed data
+    Generate an AI-powered vibe report from the analyzed data.
+
+    Returns (report, ok); when ok is False the text is a user-facing
+    fallback message, which must not be stored as the playlist's report.
     """
     # Check if OpenAI API key is available
-    api_key = os.getenv('OPENAI_API_KEY')
-    if not api_key:
-        print("OpenAI API key not found in environment variables")
-        return "AI analysis unavailable - OpenAI API key not configured. Your quantitative data is ready!"
+    client = get_openai_client()
+    if client is None:
+        logger.warning("OpenAI API key not found in environment variables")
+        return NO_KEY_MESSAGE, False
     
-    # Construct the prompt
-    prompt = create_analysis_prompt(analysis_data)
+    messages = build_report_messages(analysis_data)
     
-    try:
-        # Initialize OpenAI client
-        client = openai.OpenAI(api_key=api_key)
-        
-        # Call OpenAI API with new format
-        response = client.chat.completions.create(
-            model="gpt-4",  # or "gpt-3.5-turbo" for testing
-            messages=[
-                {"role": "system", "content": "You are a music expert and cultural analyst known for your engaging and witty personality profiles based on music taste."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=800,
-            temperature=0.8
-        )
-        
+    async def complete() -> str:
+        # Awaiting the async client keeps the event loop free during the completion
+        with stage("llm_call"):
+            response = await client.chat.completions.create(
+                model=REPORT_MODEL,
+                messages=messages,
+                max_tokens=REPORT_MAX_TOKENS,
+                temperature=REPORT_TEMPERATURE
+            )
         return response.choices[0].message.content.strip()
-        
-    except openai.AuthenticationError:
-        print("OpenAI authentication failed - check API key")
-        return "AI analysis unavailable - OpenAI authentication failed. Your quantitative data is ready!"
-    except openai.RateLimitError:
-        print("OpenAI rate limit exceeded")
-        return "AI analysis temporarily unavailable - rate limit exceeded. Your quantitative data is ready!"
-    except openai.APIError as e:
-        print(f"OpenAI API error: {e}")
-        return "AI analysis temporarily unavailable due to API error. Your quantitative data is ready!"
+    
+    try:
+        # Identical prompts share one cached (or in-flight) completion
+        return await get_report_cache().get_or_compute(report_key(messages), complete), True
     except Exception as e:
-        print(f"Unexpected error in AI report generation: {e}")
-        return "AI analysis temporarily unavailable. Your quantitative data is ready!"
+        return report_error_message(e), False
 
-def create_analysis_prompt(analysis_data: Dict[str, Any]) -> str:
-    """Create a detailed prompt for the AI analysis"""
-    basic = analysis_data["basic_analysis"]
-    samples = analysis_data["track_samples"]
+async def stream_vibe_report(analysis_data: Dict[str, Any],
+                             outcome: Optional[ReportOutcome] = None) -> AsyncIterator[str]:
+    """
+    Same report as generate_vibe_report, yielded as text deltas while the
+    completion is produced. When a fallback message is yielded instead,
+    `outcome.ok` is set to False.
+    """
+    if outcome is None:
+        outcome = ReportOutcome()
+    client = get_openai_client()
+    if client is None:
+        logger.warning("OpenAI API key not found in environment variables")
+        outcome.ok = False
+        yield NO_KEY_MESSAGE
+        return
     
-    # Format the audio features section
-    features_text = ""
-    audio_features = ['danceability', 'energy', 'valence', 'acousticness', 
-                     'instrumentalness', 'liveness', 'speechiness']
+    messages = build_report_messages(analysis_data)
+    key = report_key(messages)
+    cache = get_report_cache()
     
-    for feature in audio_features:
-        avg_key = f'avg_{feature}'
-        if avg_key in basic:
-            features_text += f"- {feature.title()}: {basic[avg_key]:.2f}/1\n"
+    cached = cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+    
+    future, owner = cache.claim(key)
+    if not owner:
+        # Someone is already generating this exact report; wait and send it whole
+        try:
+            report = await asyncio.shield(future)
+        except Exception as e:
+            outcome.ok = False
+            yield report_error_message(e)
+            return
+        yield report
+        return
     
-    # Format track samples
-    tracks_text = ""
-    for i, track in enumerate(samples[:5], 1):  # Show first 5 samples
-        tracks_text += f"{i}. '{track['name']}' by {track['artist']} (Popularity: {track['popularity']}/100)\n"
+    parts = []
+    try:
+        # The span covers the whole stream, so it includes time spent sending deltas
+        with stage("llm_call"):
+            stream = await client.chat.completions.create(
+                model=REPORT_MODEL,
+                messages=messages,
+                max_tokens=REPORT_MAX_TOKENS,
+                temperature=REPORT_TEMPERATURE,
+                stream=True
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+    except Exception as e:
+        cache.fail(key, e)
+        outcome.ok = False
+        yield report_error_message(e)
+        return
+    except BaseException:
+        # Client went away mid-stream: release the waiters, cache nothing
+        cache.fail(key, RuntimeError("Report stream was aborted"))
+        raise
+    cache.resolve(key, "".join(parts).strip())
+
+def report_error_message(error: Exception) -> str:
+    """User-facing fallback text for a failed completion"""
+    import openai
     
-    prompt = f"""
-    Analyze this music playlist and provide a engaging "vibe check" report:
+    if isinstance(error, openai.AuthenticationError):
+        logger.error("OpenAI authentication failed - check API key")
+        return "AI analysis unavailable - OpenAI authentication failed. Your quantitative data is ready!"
+    if isinstance(error, openai.RateLimitError):
+        logger.warning("OpenAI rate limit exceeded")
+        return "AI analysis temporarily unavailable - rate limit exceeded. Your quantitative data is ready!"
+    if isinstance(error, openai.APIError):
+        logger.error("OpenAI API error: %s", error)
+        return "AI analysis temporarily unavailable due to API error. Your quantitative data is ready!"
+    logger.error("Unexpected error in AI report generation: %s", error, exc_info=error)
+    return "AI analysis temporarily unavailable. Your quantitative data is ready!"
 
-    PLAYLIST: {analysis_data['playlist_name']}
-    TOTAL TRACKS: {analysis_data['total_tracks']}
-    TRACKS ANALYZED: {analysis_data['analyzed_tracks']}
+PROMPT_FEATURES = ['danceability', 'energy', 'valence', 'acousticness',
+                   'instrumentalness', 'liveness', 'speechiness']
 
-    KEY STATISTICS:
-    - Average Popularity: {basic.get('avg_popularity', 0):.1f}/100
-    - Unique Artists: {basic.get('artists_count', 0)}
-    - Unique Albums: {basic.get('albums_count', 0)}
-    - Explicit Content: {basic.get('explicit_ratio', 0)*100:.1f}% of tracks
-    - Total Duration: {basic.get('duration_minutes', 0):.1f} minutes
+PROMPT_HEADER = """Analyze this music playlist and provide a engaging "vibe check" report:
 
-    AUDIO FEATURE PROFILE:
-    {features_text}
+PLAYLIST: {playlist_name}
+TOTAL TRACKS: {total_tracks}
+TRACKS ANALYZED: {analyzed_tracks}
 
-    TOP ARTISTS: {', '.join(list(basic.get('top_artists', {}).keys())[:3])}
+KEY STATISTICS:
+- Average Popularity: {avg_popularity:.1f}/100
+- Unique Artists: {artists_count}
+- Unique Albums: {albums_count}
+- Explicit Content: {explicit_pct:.1f}% of tracks
+- Total Duration: {duration_minutes:.1f} minutes
 
-    SAMPLE TRACKS:
-    {tracks_text}
+AUDIO FEATURE PROFILE:
+"""
 
-    Please write a 3-4 paragraph analysis that:
-    1. Summarizes the overall vibe and music taste
-    2. Explains what the audio features suggest about the listener's preferences
-    3. Makes interesting observations about the artist selection and track diversity
-    4. Provides a fun, engaging personality assessment based on the music
+PROMPT_INSTRUCTIONS = """
+Please write a 3-4 paragraph analysis that:
+1. Summarizes the overall vibe and music taste
+2. Explains what the audio features suggest about the listener's preferences
+3. Makes interesting observations about the artist selection and track diversity
+4. Provides a fun, engaging personality assessment based on the music
 
-    Write in a conversational, witty style that makes the reader feel understood.
+Write in a conversational, witty style that makes the reader feel understood.
+"""
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: about 4 characters per token for English text"""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def create_analysis_prompt(analysis_data: Dict[str, Any]) -> str:
+    """Create a detailed prompt for the AI analysis"""
+    return build_analysis_prompt(analysis_data)[0]
+
+def build_analysis_prompt(analysis_data: Dict[str, Any],
+                          token_budget: Optional[int] = None) -> Tuple[str, Dict[str, int]]:
     """
+    Prompt for the vibe report filled up to `token_budget` estimated tokens,
+    plus a usage report (estimated tokens and what was included).
+    
+    The header, key statistics and instructions are always sent. Audio
+    features, the top three artists, sample tracks and then further top
+    artists are added in that order while they fit. Samples are read one
+    at a time, so only the ones that make it into the prompt get formatted.
+    """
+    if token_budget is None:
+        token_budget = PROMPT_TOKEN_BUDGET
+    basic = analysis_data["basic_analysis"]
+    samples = analysis_data["track_samples"]
+    
+    header = PROMPT_HEADER.format(
+        playlist_name=analysis_data['playlist_name'],
+        total_tracks=analysis_data['total_tracks'],
+        analyzed_tracks=analysis_data['analyzed_tracks'],
+        avg_popularity=basic.get('avg_popularity', 0),
+        artists_count=basic.get('artists_count', 0),
+        albums_count=basic.get('albums_count', 0),
+        explicit_pct=basic.get('explicit_ratio', 0) * 100,
+        duration_minutes=basic.get('duration_minutes', 0),
+    )
+    # Work in characters against the same 4-chars-per-token estimate
+    remaining = token_budget * CHARS_PER_TOKEN - len(header) - len(PROMPT_INSTRUCTIONS) \
+        - len("\nTOP ARTISTS: \n\nSAMPLE TRACKS:\n")
+    
+    def fits(text: str) -> bool:
+        nonlocal remaining
+        if len(text) > remaining:
+            return False
+        remaining -= len(text)
+        return True
+    
+    feature_lines = []
+    for feature in PROMPT_FEATURES:
+        avg_key = f'avg_{feature}'
+        if avg_key in basic:
+            line = f"- {feature.title()}: {basic[avg_key]:.2f}/1\n"
+            if not fits(line):
+                break
+            feature_lines.append(line)
+    
+    top_artists = list(basic.get('top_artists', {}).keys())
+    artists = []
+    
+    def add_artists(limit: int):
+        for name in top_artists[len(artists):limit]:
+            if not fits(f"{name}, "):
+                return
+            artists.append(name)
+    
+    add_artists(3)
+    track_lines = []
+    for i in range(len(samples)):
+        track = samples[i]
+        line = f"{i + 1}. '{track['name']}' by {track['artist']} (Popularity: {track['popularity']}/100)\n"
+        if not fits(line):
+            break
+        track_lines.append(line)
+    add_artists(10)
     
-    return prompt
\ No newline at end of file
+    prompt = (header + "".join(feature_lines)
+              + "\nTOP ARTISTS: " + ", ".join(artists) + "\n"
+              + "\nSAMPLE TRACKS:\n" + "".join(track_lines)
+              + PROMPT_INSTRUCTIONS)
+    usage = {
+        "prompt_tokens": estimate_tokens(prompt),
+        "token_budget": token_budget,
+        "features": len(feature_lines),
+        "artists": len(artists),
+        "samples": len(track_lines),
+    }
+    return prompt, usage
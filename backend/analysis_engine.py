@@ -1,30 +1,38 @@
 # analysis_engine.py
+import logging
+from collections.abc import Sequence
 from io import StringIO
 import pandas as pd
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from sampling_strategy import create_strategic_sample
+from stats_engine import PlaylistStats
+from metrics import stage
 
-def analyze_playlist_data(csv_content: str, playlist_name: str) -> Dict[str, Any]:
+logger = logging.getLogger(__name__)
+
+def analyze_playlist_csv(csv_content: str, playlist_name: str) -> Dict[str, Any]:
     """
-    Main function: Takes CSV content, returns rich analysis ready for AI
+    Adapter for Exportify CSV exports: parses the CSV, then runs the normal analysis
     """
-    # Convert CSV to DataFrame
     df = pd.read_csv(StringIO(csv_content))
-    
-    print(f"🔍 After CSV conversion - DataFrame shape: {df.shape}")
-    print(f"🔍 After CSV conversion - DataFrame columns: {list(df.columns)}")
-    print(f"🔍 After CSV conversion - Sample audio features:")
-    if 'Danceability' in df.columns:
-        print(f"  Danceability: {df['Danceability'].head(3).tolist()}")
-    if 'Energy' in df.columns:
-        print(f"  Energy: {df['Energy'].head(3).tolist()}")
-    
+    return analyze_playlist_data(df, playlist_name)
+
+def analyze_playlist_data(df: pd.DataFrame, playlist_name: str,
+                          stats: Optional[PlaylistStats] = None) -> Dict[str, Any]:
+    """
+    Main function: Takes a typed track DataFrame, returns rich analysis ready for AI
+
+    Pass `stats` when the aggregates are already known (e.g. updated
+    incrementally) to skip recomputing them from `df`.
+    """
     # 1. Basic quantitative analysis
-    basic_analysis = generate_basic_analysis(df)
+    basic_analysis = stats.finalize() if stats is not None else generate_basic_analysis(df)
     
     # 2. Strategic sampling for AI context
-    sample_df = create_strategic_sample(df, max_tracks=100)
-    track_samples = format_track_samples(sample_df)
+    # Samples are formatted lazily: the prompt builder only reads as many as fit its budget
+    with stage("sampling"):
+        sample_df = create_strategic_sample(df, max_tracks=100)
+        track_samples = TrackSamples(sample_df)
     
     # 3. Prepare data for AI
     analysis_payload = {
@@ -39,79 +47,57 @@ def analyze_playlist_data(csv_content: str, playlist_name: str) -> Dict[str, Any
 
 def generate_basic_analysis(df: pd.DataFrame) -> Dict[str, Any]:
     """Generate quantitative analysis"""
-    import math
-    
-    def safe_mean(series):
-        """Calculate mean and replace NaN with 0"""
-        mean_val = series.mean()
-        return 0 if math.isnan(mean_val) else mean_val
-    
-    def safe_std(series):
-        """Calculate std and replace NaN with 0"""
-        std_val = series.std()
-        return 0 if math.isnan(std_val) else std_val
-    
-    print(f"🔍 DataFrame columns: {list(df.columns)}")
-    print(f"🔍 DataFrame shape: {df.shape}")
-    print(f"🔍 Sample data:")
-    print(df.head(2))
-    
-    analysis = {
-        "track_count": len(df),
-        "artists_count": df['Artist Name(s)'].nunique(),
-        "albums_count": df['Album Name'].nunique(),
-        "avg_popularity": safe_mean(df['Popularity']) if 'Popularity' in df.columns else 0,
-        "duration_minutes": (df['Duration (ms)'].sum() / 60000) if 'Duration (ms)' in df.columns else 0,
-    }
-    
-    # Handle Explicit column (might be boolean or string)
-    if 'Explicit' in df.columns:
-        if df['Explicit'].dtype == 'bool':
-            analysis["explicit_ratio"] = safe_mean(df['Explicit'])
-        else:
-            # Handle string values like 'True'/'False'
-            analysis["explicit_ratio"] = safe_mean((df['Explicit'].str.lower() == 'true').astype(float))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"🔍 DataFrame columns: {list(df.columns)}")
+        logger.debug(f"🔍 DataFrame shape: {df.shape}")
+        logger.debug(f"🔍 Sample data:\n{df.head(2)}")
     
-    # Audio features analysis
-    audio_features = ['Danceability', 'Energy', 'Valence', 'Acousticness', 
-                     'Instrumentalness', 'Liveness', 'Speechiness', 'Tempo']
+    # Every metric comes out of one vectorized pass; see stats_engine for
+    # the mergeable partials used when stats are built chunk by chunk
+    with stage("statistics"):
+        analysis = PlaylistStats.from_dataframe(df).finalize()
     
-    print(f"🔍 Processing audio features...")
-    for feature in audio_features:
-        if feature in df.columns:
-            mean_val = safe_mean(df[feature])
-            std_val = safe_std(df[feature])
-            analysis[f'avg_{feature.lower()}'] = mean_val
-            analysis[f'std_{feature.lower()}'] = std_val
-            print(f"🔍 {feature}: mean={mean_val}, std={std_val}")
-        else:
-            print(f"❌ {feature} not found in columns")
-    
-    # Top artists
-    if 'Artist Name(s)' in df.columns:
-        analysis['top_artists'] = df['Artist Name(s)'].value_counts().head(10).to_dict()
-    
-    print(f"🔍 Final analysis keys: {list(analysis.keys())}")
-    print(f"🔍 Audio feature averages: {[k for k in analysis.keys() if k.startswith('avg_')]}")
+    logger.debug("🔍 Final analysis keys: %s", list(analysis.keys()))
     
     return analysis
 
+SAMPLE_FEATURES = ['Danceability', 'Energy', 'Valence', 'Acousticness']
+
+class TrackSamples(Sequence):
+    """
+    Track samples for AI context, formatted on access.
+
+    The sampled columns are pulled out as lists of plain Python scalars
+    once, up front; indexing then only builds one sample dict, so a prompt
+    that shows five tracks formats five, not all.
+    """
+
+    def __init__(self, sample_df: pd.DataFrame):
+        self._length = len(sample_df)
+        fields = [('name', 'Track Name', 'Unknown Track'),
+                  ('artist', 'Artist Name(s)', 'Unknown Artist'),
+                  ('popularity', 'Popularity', 0)]
+        # Add audio features if available
+        fields += [(f.lower(), f, None) for f in SAMPLE_FEATURES if f in sample_df.columns]
+        # tolist() gives Python scalars, so samples stay JSON-serializable;
+        # a missing column becomes None and falls back to its default
+        self._fields = [
+            (key, sample_df[column].tolist() if column in sample_df.columns else None, default)
+            for key, column, default in fields
+        ]
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("track sample index out of range")
+        return {key: default if values is None else values[index] for key, values, default in self._fields}
+
 def format_track_samples(sample_df: pd.DataFrame) -> List[Dict]:
     """Format track samples for AI context"""
-    samples = []
-    for _, track in sample_df.iterrows():
-        sample_data = {
-            "name": track.get('Track Name', 'Unknown Track'),
-            "artist": track.get('Artist Name(s)', 'Unknown Artist'),
-            "popularity": track.get('Popularity', 0),
-        }
-        
-        # Add audio features if available
-        audio_features = ['Danceability', 'Energy', 'Valence', 'Acousticness']
-        for feature in audio_features:
-            if feature in track:
-                sample_data[feature.lower()] = track[feature]
-        
-        samples.append(sample_data)
-    
-    return samples
\ No newline at end of file
+    return list(TrackSamples(sample_df))
@@ -0,0 +1,187 @@
+# analysis_pool.py
+import asyncio
+import math
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from metrics import call_capturing, replay_captured
+
+
+class AnalysisPoolFull(Exception):
+    """Raised instead of queueing when the pool's bounded queue is full"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Analysis queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AnalysisTicket:
+    """
+    One admitted request. Its jobs wait for a worker slot but are never
+    rejected, so a request that got in isn't turned away between stages.
+    Release it (or leave the `with` block) once the request's CPU work is done.
+    """
+
+    def __init__(self, pool: "AnalysisPool"):
+        self._pool = pool
+        self._released = False
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run `fn(*args)` in the pool, waiting for a slot"""
+        return await self._pool._run_admitted(fn, *args)
+
+    async def run_local(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Like `run`, but always on a thread of this process: for jobs that use
+        something a worker process can't be handed, such as an open file
+        """
+        return await self._pool._run_admitted(fn, *args, local=True)
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._pool.admitted -= 1
+
+    def __enter__(self) -> "AnalysisTicket":
+        return self
+
+    def __exit__(self, *exc_info: Any):
+        self.release()
+
+
+class AnalysisPool:
+    """
+    Runs CPU-bound analysis off the event loop with admission control.
+
+    At most `max_workers` jobs run at once in a thread or process pool.
+    Requests are admitted once, with `admit()`, however many jobs they
+    run; at most `max_workers + max_queue` are admitted at a time and
+    anything beyond that is rejected immediately with AnalysisPoolFull,
+    so the caller can answer 503 + Retry-After instead of piling up latency.
+    In process mode, the stage timings and counters a job records in its
+    worker are sent back with the result and replayed into this process.
+    """
+
+    def __init__(self, kind: Optional[str] = None, max_workers: Optional[int] = None,
+                 max_queue: Optional[int] = None):
+        if kind is None:
+            kind = os.getenv("ANALYSIS_POOL_KIND", "thread")
+        if max_workers is None:
+            max_workers = int(os.getenv("ANALYSIS_POOL_WORKERS", str(os.cpu_count() or 1)))
+        if max_queue is None:
+            max_queue = int(os.getenv("ANALYSIS_POOL_QUEUE", str(max_workers * 2)))
+        if kind not in ("thread", "process"):
+            raise ValueError(f"ANALYSIS_POOL_KIND must be 'thread' or 'process', got {kind!r}")
+
+        self.kind = kind
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor: Executor = (
+            ProcessPoolExecutor(self.max_workers) if kind == "process"
+            else ThreadPoolExecutor(self.max_workers, thread_name_prefix="analysis")
+        )
+        self._slots = asyncio.Semaphore(self.max_workers)
+
+        self.admitted = 0
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.max_queue_depth = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+
+    def _retry_after(self) -> int:
+        """Rough seconds until a slot frees up, from the average job time"""
+        avg_run = self.total_run_seconds / self.completed if self.completed else 1.0
+        return max(1, math.ceil(avg_run * (self.admitted - self.max_workers + 1) / self.max_workers))
+
+    def admit(self) -> AnalysisTicket:
+        """Admit one request, or raise AnalysisPoolFull if the queue is full"""
+        if self.admitted >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise AnalysisPoolFull(self._retry_after())
+        self.admitted += 1
+        return AnalysisTicket(self)
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Admit a single-job request and run `fn(*args)` in the pool"""
+        with self.admit() as ticket:
+            return await ticket.run(fn, *args)
+
+    async def _run_admitted(self, fn: Callable[..., Any], *args: Any, local: bool = False) -> Any:
+        self.queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queued)
+        enqueued_at = time.perf_counter()
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+
+        try:
+            wait = time.perf_counter() - enqueued_at
+            self.total_wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+            self.running += 1
+            started_at = time.perf_counter()
+            try:
+                loop = asyncio.get_running_loop()
+                if self.kind == "thread":
+                    return await loop.run_in_executor(self._executor, partial(fn, *args))
+                if local:
+                    # None is the event loop's default thread pool
+                    return await loop.run_in_executor(None, partial(fn, *args))
+                result, error, observations = await loop.run_in_executor(
+                    self._executor, partial(call_capturing, fn, *args)
+                )
+                replay_captured(observations)
+                if error is not None:
+                    raise error
+                return result
+            finally:
+                self.running -= 1
+                self.completed += 1
+                self.total_run_seconds += time.perf_counter() - started_at
+        finally:
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "queue_depth": self.queued,
+            "max_queue_depth": self.max_queue_depth,
+            "running": self.running,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": 1000 * self.total_wait_seconds / self.completed if self.completed else 0.0,
+            "max_wait_ms": 1000 * self.max_wait_seconds,
+            "avg_run_ms": 1000 * self.total_run_seconds / self.completed if self.completed else 0.0,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool: Optional[AnalysisPool] = None
+
+
+def get_analysis_pool() -> AnalysisPool:
+    global _pool
+    if _pool is None:
+        _pool = AnalysisPool()
+    return _pool
+
+
+def close_analysis_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
@@ -0,0 +1,129 @@
+# analysis_state.py
+from __future__ import annotations
+
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from track_schema import ARTISTS_COLUMN
+
+# pandas only comes in when a stored track table is unpickled, so the
+# snapshot-cache check stays cheap on a cold start
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from stats_engine import PlaylistStats
+
+
+@dataclass
+class PlaylistState:
+    """
+    Everything needed to answer or incrementally update one playlist's analysis.
+
+    `tracks` and `stats` are None for playlists analyzed on the small-playlist
+    fast path; those are refetched in full when their snapshot changes.
+    `response` is None when the AI report failed, so it isn't replayed.
+    """
+    playlist_id: str
+    snapshot_id: str
+    response: Optional[Dict[str, Any]]
+    tracks: Optional[pd.DataFrame]
+    stats: Optional[PlaylistStats]
+
+
+class AnalysisStateStore:
+    """
+    Per-playlist analysis state persisted in SQLite, keyed by playlist_id.
+
+    Each row keeps the snapshot_id it was computed for, the response that
+    was returned, the typed track table and the mergeable aggregates, so a
+    changed snapshot can be updated by diffing tracks instead of refetching.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        if db_path is None:
+            db_path = os.getenv("ANALYSIS_STATE_PATH", "./analysis_state.sqlite3")
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS playlist_state ("
+            "playlist_id TEXT PRIMARY KEY, snapshot_id TEXT NOT NULL, response TEXT NOT NULL, "
+            "tracks BLOB NOT NULL, stats BLOB NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def load(self, playlist_id: str) -> Optional[PlaylistState]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT snapshot_id, response, tracks, stats FROM playlist_state WHERE playlist_id = ?",
+                (playlist_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        snapshot_id, response, tracks, stats = row
+        tracks, stats = pickle.loads(tracks), pickle.loads(stats)
+        if tracks is not None and ARTISTS_COLUMN not in tracks.columns:
+            # Saved before artists were counted individually; its aggregates
+            # can't be diffed against, so the playlist is refetched in full
+            tracks = stats = None
+        return PlaylistState(playlist_id, snapshot_id, json.loads(response), tracks, stats)
+
+    def load_response(self, playlist_id: str, snapshot_id: str) -> Optional[Dict[str, Any]]:
+        """Stored response if one was kept for `snapshot_id`, without unpickling the tracks"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response FROM playlist_state WHERE playlist_id = ? AND snapshot_id = ?",
+                (playlist_id, snapshot_id),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, state: PlaylistState):
+        payload = (
+            state.playlist_id, state.snapshot_id, json.dumps(state.response),
+            pickle.dumps(state.tracks, protocol=pickle.HIGHEST_PROTOCOL),
+            pickle.dumps(state.stats, protocol=pickle.HIGHEST_PROTOCOL),
+            time.time(),
+        )
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO playlist_state "
+                "(playlist_id, snapshot_id, response, tracks, stats, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                payload,
+            )
+            self._db.commit()
+
+
+def diff_track_ids(old_ids: List[str], new_ids: List[str]) -> Tuple[Counter, Counter]:
+    """(added, removed) as multisets, so duplicate tracks in a playlist are handled"""
+    old_counts = Counter(old_ids)
+    new_counts = Counter(new_ids)
+    return new_counts - old_counts, old_counts - new_counts
+
+
+def select_removed_rows(tracks: pd.DataFrame, removed: Counter) -> pd.Series:
+    """Boolean mask picking `removed[id]` occurrences of each removed track ID"""
+    import pandas as pd
+
+    if not removed:
+        return pd.Series(False, index=tracks.index)
+    track_ids = tracks["Track ID"]
+    occurrence = track_ids.groupby(track_ids, sort=False).cumcount()
+    limit = track_ids.map(removed).fillna(0)
+    return occurrence < limit
+
+
+_store: Optional[AnalysisStateStore] = None
+
+
+def get_analysis_state_store() -> AnalysisStateStore:
+    global _store
+    if _store is None:
+        _store = AnalysisStateStore()
+    return _store
@@ -0,0 +1,163 @@
+# analysis_store.py
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from track_schema import AUDIO_FEATURE_COLUMNS
+
+if TYPE_CHECKING:
+    from playlist_index import BruteForceIndex
+
+# One dimension per audio-feature mean and spread, as produced by generate_basic_analysis
+FEATURE_VECTOR_KEYS = [f"{prefix}_{column.lower()}" for column, _ in AUDIO_FEATURE_COLUMNS
+                       for prefix in ("avg", "std")]
+
+
+def feature_vector(basic_analysis: Dict[str, Any]) -> List[float]:
+    """The playlist's position in feature space; missing metrics count as 0"""
+    return [float(basic_analysis.get(key) or 0.0) for key in FEATURE_VECTOR_KEYS]
+
+
+class PlaylistAnalysisStore:
+    """
+    Every completed playlist analysis persisted in SQLite, with its feature
+    vector, plus an in-memory nearest-neighbour index over those vectors.
+
+    The index (and NumPy with it) is only built from disk on the first
+    search, so saving stays cheap on the small-playlist fast path. Writes
+    by other worker processes sharing the file are picked up on the next
+    search via SQLite's data_version, which only changes on other
+    connections' commits.
+
+    Each playlist is stored with its owner and whether it is public, and a
+    search only returns playlists the viewer may see: public ones and their
+    own. Rows saved before owners were recorded are visible to nobody until
+    the playlist is analyzed again.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        if db_path is None:
+            db_path = os.getenv("ANALYSIS_STORE_PATH", "./analysis_store.sqlite3")
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS playlist_analysis ("
+            "playlist_id TEXT PRIMARY KEY, playlist_name TEXT NOT NULL, analysis TEXT NOT NULL, "
+            "vector BLOB NOT NULL, updated_at REAL NOT NULL, owner_id TEXT, public INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(playlist_analysis)")}
+        if "owner_id" not in columns:
+            # Stores created before visibility was tracked
+            self._db.execute("ALTER TABLE playlist_analysis ADD COLUMN owner_id TEXT")
+            self._db.execute("ALTER TABLE playlist_analysis ADD COLUMN public INTEGER NOT NULL DEFAULT 0")
+        self._db.commit()
+        self._index: Optional[BruteForceIndex] = None
+        # playlist_id -> (name, owner_id, public)
+        self._playlists: Dict[str, Tuple[str, Optional[str], bool]] = {}
+        self._data_version: Optional[int] = None
+
+        self.saves = 0
+        self.searches = 0
+        self.search_seconds = 0.0
+
+    def _current_index(self) -> BruteForceIndex:
+        """The in-memory index, (re)built from disk if missing or stale; call with the lock held"""
+        data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        if self._index is None or data_version != self._data_version:
+            from playlist_index import BruteForceIndex
+            index = BruteForceIndex(len(FEATURE_VECTOR_KEYS))
+            playlists = {}
+            for playlist_id, playlist_name, vector, owner_id, public in self._db.execute(
+                "SELECT playlist_id, playlist_name, vector, owner_id, public FROM playlist_analysis"
+            ):
+                index.upsert(playlist_id, array("d", vector))
+                playlists[playlist_id] = (playlist_name, owner_id, bool(public))
+            self._index, self._playlists, self._data_version = index, playlists, data_version
+        return self._index
+
+    def _visible(self, playlist_id: str, viewer_id: Optional[str]) -> bool:
+        _, owner_id, public = self._playlists.get(playlist_id, ("", None, False))
+        return public or (viewer_id is not None and owner_id == viewer_id)
+
+    def save(self, playlist_id: str, playlist_name: str, basic_analysis: Dict[str, Any],
+             owner_id: Optional[str] = None, public: bool = False):
+        vector = feature_vector(basic_analysis)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO playlist_analysis "
+                "(playlist_id, playlist_name, analysis, vector, updated_at, owner_id, public) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (playlist_id, playlist_name, json.dumps(basic_analysis), array("d", vector).tobytes(), time.time(),
+                 owner_id, int(public)),
+            )
+            self._db.commit()
+            self.saves += 1
+            if self._index is not None:
+                self._index.upsert(playlist_id, vector)
+                self._playlists[playlist_id] = (playlist_name, owner_id, public)
+
+    def load_analysis(self, playlist_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT analysis FROM playlist_analysis WHERE playlist_id = ?", (playlist_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def similar(self, playlist_id: str, k: int = 10,
+                viewer_id: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        The `k` stored playlists closest to `playlist_id` that `viewer_id`
+        may see, or None if it isn't stored or isn't visible to them.
+        """
+        started_at = time.perf_counter()
+        with self._lock:
+            index = self._current_index()
+            query = index.vector(playlist_id)
+            if query is None or not self._visible(playlist_id, viewer_id):
+                return None
+            # Over-fetch until k visible neighbours turn up or the index runs out
+            fetch = k
+            while True:
+                neighbours = [(neighbour, distance) for neighbour, distance
+                              in index.search(query, fetch, exclude=playlist_id)
+                              if self._visible(neighbour, viewer_id)]
+                if len(neighbours) >= k or fetch >= len(index):
+                    break
+                fetch *= 4
+            playlists = self._playlists
+            self.searches += 1
+            self.search_seconds += time.perf_counter() - started_at
+        return [
+            {"playlist_id": neighbour, "playlist_name": playlists[neighbour][0], "distance": round(distance, 4)}
+            for neighbour, distance in neighbours[:k]
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "indexed_playlists": len(self._index) if self._index is not None else 0,
+                "saves": self.saves,
+                "searches": self.searches,
+                "avg_search_ms": 1000 * self.search_seconds / self.searches if self.searches else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_store: Optional[PlaylistAnalysisStore] = None
+
+
+def get_playlist_analysis_store() -> PlaylistAnalysisStore:
+    global _store
+    if _store is None:
+        _store = PlaylistAnalysisStore()
+    return _store
@@ -0,0 +1,62 @@
+# bench_csv_roundtrip.py
+"""
+Regression benchmark: per-request cost of the old DataFrame -> CSV -> DataFrame
+round trip versus handing the typed DataFrame straight to the analysis engine.
+
+Run from backend/:  python benchmarks/bench_csv_roundtrip.py [n_tracks] [repeats]
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis_engine import analyze_playlist_csv, analyze_playlist_data  # noqa: E402
+from synthetic import make_playlist_df  # noqa: E402
+
+
+def old_path(df: pd.DataFrame):
+    return analyze_playlist_csv(df.to_csv(index=False), "bench")
+
+
+def new_path(df: pd.DataFrame):
+    return analyze_playlist_data(df, "bench")
+
+
+def measure(fn, df: pd.DataFrame, repeats: int):
+    """Best wall time and peak traced allocation for `fn(df)`"""
+    best = float("inf")
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn(df)
+            best = min(best, time.perf_counter() - start)
+        tracemalloc.start()
+        fn(df)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    n_tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    df = make_playlist_df(n_tracks)
+
+    old_time, old_peak = measure(old_path, df, repeats)
+    new_time, new_peak = measure(new_path, df, repeats)
+
+    print(f"{n_tracks} tracks, best of {repeats}")
+    print(f"  csv round trip : {old_time * 1000:8.1f} ms  peak {old_peak / 1e6:7.1f} MB")
+    print(f"  typed DataFrame: {new_time * 1000:8.1f} ms  peak {new_peak / 1e6:7.1f} MB")
+    print(f"  saving per request: {(old_time - new_time) * 1000:.1f} ms, "
+          f"{(old_peak - new_peak) / 1e6:.1f} MB peak")
+
+
+if __name__ == "__main__":
+    main()
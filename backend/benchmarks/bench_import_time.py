@@ -0,0 +1,101 @@
+# bench_import_time.py
+"""
+Cold-start budget check: time `import main` in fresh interpreters and make
+sure the heavy dependencies stay out of the import path.
+
+Run from backend/:
+  python benchmarks/bench_import_time.py [--runs 5] [--budget-ms 150] [--top 10]
+
+FastAPI itself is timed first and the budget applies to what `import main`
+adds on top of it, which is what this codebase controls and is far less
+machine-dependent than the total. Exit status is 1 when the median is over
+budget or any of HEAVY_MODULES is loaded, so it can gate a deploy.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only the routes that need these may import them
+HEAVY_MODULES = ("pandas", "numpy", "openai", "httpx", "requests", "http.server")
+
+PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import fastapi, fastapi.middleware.cors, fastapi.responses
+framework = time.perf_counter()
+import main
+done = time.perf_counter()
+print(json.dumps({{"framework_ms": (framework - start) * 1000, "app_ms": (done - framework) * 1000,
+                  "heavy": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def probe_once() -> Dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=BACKEND_DIR, check=True, capture_output=True, text=True,
+        env=dict(os.environ, LOG_LEVEL="WARNING"),
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(top: int) -> List[Tuple[int, str]]:
+    """(cumulative microseconds, module) for main's `top` slowest direct imports, from -X importtime"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR, check=True,
+        capture_output=True, text=True, env=dict(os.environ, LOG_LEVEL="WARNING"),
+    ).stderr
+    # Children are printed before their parent, indented two spaces per level
+    children: List[Tuple[int, str]] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip()) + 1) // 2
+        if depth == 1:
+            if name.strip() == "main":
+                return sorted(children, reverse=True)[:top]
+            children = []
+        elif depth == 2:
+            children.append((int(cumulative), name.strip()))
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=150.0, help="budget for main on top of FastAPI")
+    parser.add_argument("--top", type=int, default=10, help="show main's N slowest imports")
+    args = parser.parse_args()
+
+    results = [probe_once() for _ in range(args.runs)]
+    framework = [result["framework_ms"] for result in results]
+    times = [result["app_ms"] for result in results]
+    heavy = sorted({module for result in results for module in result["heavy"]})
+
+    print(f"import main, {args.runs} fresh interpreters (median / best)")
+    print(f"  fastapi       {statistics.median(framework):7.1f} ms  {min(framework):7.1f} ms")
+    print(f"  main on top   {statistics.median(times):7.1f} ms  {min(times):7.1f} ms  budget {args.budget_ms:.0f} ms")
+    if args.top:
+        print("  slowest imports made by main:")
+        for us, name in slowest_imports(args.top):
+            print(f"    {us / 1000:7.1f} ms  {name}")
+
+    failures = []
+    if statistics.median(times) > args.budget_ms:
+        failures.append(f"main adds {statistics.median(times):.1f} ms, over the {args.budget_ms:.0f} ms budget")
+    if heavy:
+        failures.append(f"heavy modules loaded at import: {', '.join(heavy)}")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
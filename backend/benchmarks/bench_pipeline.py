@@ -0,0 +1,102 @@
+# bench_pipeline.py
+"""
+Microbenchmarks for the CPU-bound pipeline stages on seeded synthetic
+playlists: DataFrame build, statistics, sampling and sample formatting.
+
+Run from backend/:
+  python benchmarks/bench_pipeline.py [--sizes 100,1000,10000,50000] [--repeats 5]
+  python benchmarks/bench_pipeline.py --save baseline.json
+  python benchmarks/bench_pipeline.py --compare baseline.json --tolerance 0.25
+
+With --compare the exit status is 1 when any stage's best time is slower
+than the baseline by more than the tolerance, so it can gate a deploy (best
+of N is steadier than the median on a shared machine).
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from analysis_engine import format_track_samples, generate_basic_analysis  # noqa: E402
+from main import create_dataframe_from_spotify_data  # noqa: E402
+from sampling_strategy import create_strategic_sample  # noqa: E402
+from synthetic import PLAYLIST_SIZES, make_spotify_playlist  # noqa: E402
+
+
+def timings(fn: Callable[[], object], repeats: int) -> List[float]:
+    """Wall times of `repeats` calls after one warm-up call"""
+    fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_size(n_tracks: int, repeats: int) -> Dict[str, Dict[str, float]]:
+    tracks, audio_features_map = make_spotify_playlist(n_tracks)
+    df = create_dataframe_from_spotify_data(tracks, audio_features_map)
+    sample_df = create_strategic_sample(df, max_tracks=100)
+
+    stages = {
+        "create_dataframe_from_spotify_data": lambda: create_dataframe_from_spotify_data(tracks, audio_features_map),
+        "generate_basic_analysis": lambda: generate_basic_analysis(df),
+        "create_strategic_sample": lambda: create_strategic_sample(df, max_tracks=100),
+        "format_track_samples": lambda: format_track_samples(sample_df),
+    }
+    results = {}
+    for name, fn in stages.items():
+        samples = timings(fn, repeats)
+        results[name] = {"median_ms": 1000 * statistics.median(samples), "best_ms": 1000 * min(samples)}
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """Stages whose best time regressed past `tolerance` (a fraction of the baseline)"""
+    regressions = []
+    for size, stages in results.items():
+        for name, result in stages.items():
+            before = baseline.get(size, {}).get(name)
+            if before and result["best_ms"] > before["best_ms"] * (1 + tolerance):
+                regressions.append(f"{name} @ {size} tracks: {before['best_ms']:.2f} ms -> "
+                                   f"{result['best_ms']:.2f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(str(n) for n in PLAYLIST_SIZES))
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--save", help="write results as a JSON baseline")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    results = {}
+    for n_tracks in (int(n) for n in args.sizes.split(",")):
+        results[str(n_tracks)] = bench_size(n_tracks, args.repeats)
+        print(f"{n_tracks} tracks, median / best of {args.repeats}")
+        for name, result in results[str(n_tracks)].items():
+            print(f"  {name:36s} {result['median_ms']:9.2f} ms  {result['best_ms']:9.2f} ms")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
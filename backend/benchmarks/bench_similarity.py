@@ -0,0 +1,61 @@
+# bench_similarity.py
+"""
+Latency of the similar-playlists search over a store of synthetic analyses.
+
+Run from backend/:
+  python benchmarks/bench_similarity.py [--playlists 1000,10000,100000] [--k 10] [--queries 200]
+
+Vectors are inserted straight into the in-memory index (the store's SQLite
+table is only read on a cold start), then random stored playlists are
+queried. Past the point where p99 stops being a few milliseconds, swap
+BruteForceIndex for a partitioned one.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis_store import FEATURE_VECTOR_KEYS  # noqa: E402
+from playlist_index import BruteForceIndex  # noqa: E402
+
+
+def bench(n_playlists: int, k: int, queries: int, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    vectors = rng.random((n_playlists, len(FEATURE_VECTOR_KEYS)))
+    # Tempo mean/spread are in BPM, like the real vectors
+    vectors[:, -2:] *= (180, 40)
+
+    index = BruteForceIndex(len(FEATURE_VECTOR_KEYS))
+    start = time.perf_counter()
+    for i, vector in enumerate(vectors):
+        index.upsert(f"p{i}", vector)
+    build_seconds = time.perf_counter() - start
+
+    latencies = []
+    for i in rng.integers(0, n_playlists, queries):
+        start = time.perf_counter()
+        index.search(vectors[i], k, exclude=f"p{i}")
+        latencies.append(time.perf_counter() - start)
+    latencies_ms = np.asarray(latencies) * 1000
+    print(f"  {n_playlists:8d} playlists  build {build_seconds * 1000:8.1f} ms  "
+          f"search p50 {np.percentile(latencies_ms, 50):6.2f} ms  p99 {np.percentile(latencies_ms, 99):6.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--playlists", default="1000,10000,100000")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"k={args.k}, {args.queries} queries, {len(FEATURE_VECTOR_KEYS)} dimensions")
+    for n_playlists in (int(n) for n in args.playlists.split(",")):
+        bench(n_playlists, args.k, args.queries)
+
+
+if __name__ == "__main__":
+    main()
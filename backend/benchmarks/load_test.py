@@ -0,0 +1,109 @@
+# load_test.py
+"""
+Concurrent load test of POST /analyze/playlist/{id} against stub Spotify and
+OpenAI upstreams, in-process over ASGI. Reports throughput, p50/p99 latency,
+status codes and the mean time per pipeline stage.
+
+Run from backend/:
+  python benchmarks/load_test.py [--requests 200] [--concurrency 20] [--tracks 500]
+      [--playlists N] [--spotify-latency 0.02] [--openai-latency 0.5]
+      [--rate-limit-ratio 0.0] [--retry-after 1]
+
+Every request hits a different playlist unless --playlists is smaller than
+--requests, in which case repeats are answered from the snapshot cache.
+Caches and analysis state live in a temporary directory. The Spotify rate
+limiter runs as in production: adaptive, so it only throttles once the stub
+sends 429s (--rate-limit-ratio); pin fixed rates with
+SPOTIFY_APP_RATE_PER_SEC / SPOTIFY_TOKEN_RATE_PER_SEC.
+503s in the status counts are analysis-pool admission control; size the pool
+with ANALYSIS_POOL_WORKERS / ANALYSIS_POOL_QUEUE as in production.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_state_dir = tempfile.mkdtemp(prefix="vibe-load-")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("ANALYSIS_STATE_PATH", os.path.join(_state_dir, "analysis_state.sqlite3"))
+os.environ.setdefault("ANALYSIS_STORE_PATH", os.path.join(_state_dir, "analysis_store.sqlite3"))
+os.environ.setdefault("AUDIO_FEATURES_CACHE_PATH", "")
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+from analysis_pool import close_analysis_pool  # noqa: E402
+from metrics import STAGE_SECONDS  # noqa: E402
+from openai_client import close_openai_client  # noqa: E402
+from spotify_auth import close_spotify_auth  # noqa: E402
+from spotify_client import close_spotify_client  # noqa: E402
+from stubs import StubOpenAI, StubSpotify, install_stubs  # noqa: E402
+
+
+async def run_load(args) -> None:
+    spotify = StubSpotify(tracks_per_playlist=args.tracks, latency=args.spotify_latency,
+                          jitter=args.spotify_latency, rate_limit_ratio=args.rate_limit_ratio,
+                          retry_after=args.retry_after)
+    openai_stub = StubOpenAI(latency=args.openai_latency, jitter=args.openai_latency / 2,
+                             rate_limit_ratio=args.rate_limit_ratio, retry_after=args.retry_after)
+    install_stubs(spotify, openai_stub)
+
+    n_playlists = args.playlists or args.requests
+    latencies = []
+    statuses: Counter = Counter()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    transport = httpx.ASGITransport(app=main.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=None) as client:
+        async def one_request(i: int):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(f"/analyze/playlist/load{i % n_playlists}",
+                                             headers={"Authorization": "Bearer load-test"})
+                latencies.append(time.perf_counter() - start)
+                statuses[response.status_code] += 1
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*(one_request(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - started_at
+
+    await close_spotify_auth()
+    await close_spotify_client()
+    await close_openai_client()
+    close_analysis_pool()
+
+    latencies_ms = np.asarray(latencies) * 1000
+    print(f"{args.requests} requests, concurrency {args.concurrency}, {args.tracks} tracks/playlist, "
+          f"{n_playlists} playlists")
+    print(f"  throughput : {args.requests / elapsed:8.1f} req/s  ({elapsed:.2f} s total)")
+    print(f"  latency    : p50 {np.percentile(latencies_ms, 50):8.1f} ms  "
+          f"p99 {np.percentile(latencies_ms, 99):8.1f} ms  max {latencies_ms.max():8.1f} ms")
+    print(f"  statuses   : {dict(sorted(statuses.items()))}")
+    print(f"  upstreams  : spotify {spotify.stats()}  openai {openai_stub.stats()}")
+    print("  mean per stage:")
+    for key, (count, total) in sorted(STAGE_SECONDS.totals().items()):
+        print(f"    {dict(key)['stage']:16s} {1000 * total / count:8.2f} ms  x{count}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--tracks", type=int, default=500)
+    parser.add_argument("--playlists", type=int, default=0, help="distinct playlists (default: one per request)")
+    parser.add_argument("--spotify-latency", type=float, default=0.02, help="seconds per Spotify call")
+    parser.add_argument("--openai-latency", type=float, default=0.5, help="seconds per completion")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="share of upstream calls answered 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds on injected 429s")
+    asyncio.run(run_load(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,161 @@
+# stubs.py
+"""
+Local stand-ins for the Spotify Web API (plus its accounts token endpoint)
+and the OpenAI chat endpoint, as async httpx handlers for
+httpx.MockTransport. Both inject configurable latency and a configurable
+share of 429 responses with Retry-After, so the retry and rate-limit paths
+are exercised without touching the network.
+"""
+import asyncio
+import json
+import random
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from synthetic import make_spotify_playlist
+
+REPORT_TEXT = "Your playlist is a late-night drive with the windows down and no particular destination."
+
+
+class StubUpstream:
+    """Shared latency / 429 injection and request counters"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, rate_limit_ratio: float = 0.0,
+                 retry_after: int = 1, seed: int = 42):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+        self.requests = 0
+        self.rate_limited = 0
+
+    async def _delay_or_throttle(self) -> Optional[httpx.Response]:
+        """Sleep for the simulated latency; a 429 response if this request is throttled"""
+        self.requests += 1
+        delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.rate_limit_ratio and self._rng.random() < self.rate_limit_ratio:
+            self.rate_limited += 1
+            return httpx.Response(429, headers={"Retry-After": str(self.retry_after)},
+                                  json={"error": {"status": 429, "message": "API rate limit exceeded"}})
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"requests": self.requests, "rate_limited": self.rate_limited}
+
+
+class StubSpotify(StubUpstream):
+    """
+    Playlist, playlist-tracks, tracks and audio-features endpoints.
+
+    Every playlist ID maps to a deterministic synthetic playlist of
+    `tracks_per_playlist` tracks, seeded from the ID.
+    """
+
+    def __init__(self, tracks_per_playlist: int = 500, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.tracks_per_playlist = tracks_per_playlist
+        self._playlists: Dict[str, list] = {}
+        self._tracks: Dict[str, Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+        self.tokens_issued = 0
+
+    def playlist(self, playlist_id: str) -> list:
+        tracks = self._playlists.get(playlist_id)
+        if tracks is None:
+            tracks, features = make_spotify_playlist(
+                self.tracks_per_playlist, seed=zlib.crc32(playlist_id.encode()), prefix=f"{playlist_id}x"
+            )
+            self._playlists[playlist_id] = tracks
+            for track in tracks:
+                self._tracks[track["id"]] = (track, features[track["id"]])
+        return tracks
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        throttled = await self._delay_or_throttle()
+        if throttled is not None:
+            return throttled
+
+        parts = request.url.path.strip("/").split("/")[1:]  # drop the "v1" (or accounts "api") prefix
+        params = request.url.params
+        if parts[:1] == ["playlists"] and len(parts) == 2:
+            self.playlist(parts[1])
+            return httpx.Response(200, json={"id": parts[1], "name": f"Playlist {parts[1]}",
+                                             "snapshot_id": f"{parts[1]}-snapshot",
+                                             "owner": {"id": "stub-user"}, "public": True})
+        if parts[:1] == ["playlists"] and parts[2:] == ["tracks"]:
+            tracks = self.playlist(parts[1])
+            offset = int(params.get("offset", 0))
+            limit = int(params.get("limit", 100))
+            return httpx.Response(200, json={"total": len(tracks),
+                                             "items": [{"track": t} for t in tracks[offset:offset + limit]]})
+        if parts == ["tracks"]:
+            ids = params.get("ids", "").split(",")
+            return httpx.Response(200, json={"tracks": [self._tracks.get(i, (None, None))[0] for i in ids]})
+        if parts == ["me"]:
+            return httpx.Response(200, json={"id": "stub-user"})
+        if parts == ["token"]:
+            # accounts.spotify.com/api/token: both grant types get a fresh one-hour token
+            self.tokens_issued += 1
+            return httpx.Response(200, json={"access_token": f"stub-token-{self.tokens_issued}",
+                                             "token_type": "Bearer", "expires_in": 3600,
+                                             "refresh_token": "stub-refresh"})
+        if parts == ["audio-features"]:
+            ids = params.get("ids", "").split(",")
+            return httpx.Response(200, json={"audio_features": [self._tracks.get(i, (None, None))[1] for i in ids]})
+        return httpx.Response(404, json={"error": {"status": 404, "message": "Not found"}})
+
+
+class StubOpenAI(StubUpstream):
+    """Chat completions endpoint, plain and streamed (server-sent events)"""
+
+    def __init__(self, report_text: str = REPORT_TEXT, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.report_text = report_text
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        throttled = await self._delay_or_throttle()
+        if throttled is not None:
+            return throttled
+        if not request.url.path.endswith("/chat/completions"):
+            return httpx.Response(404, json={"error": {"message": "Not found"}})
+
+        body = json.loads(request.content)
+        base = {"id": "chatcmpl-stub", "created": 0, "model": body.get("model", "stub")}
+        if body.get("stream"):
+            events = []
+            for word in self.report_text.split(" "):
+                chunk = dict(base, object="chat.completion.chunk",
+                             choices=[{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}])
+                events.append(f"data: {json.dumps(chunk)}\n\n")
+            events.append("data: [DONE]\n\n")
+            return httpx.Response(200, content="".join(events).encode(),
+                                  headers={"content-type": "text/event-stream"})
+        return httpx.Response(200, json=dict(
+            base, object="chat.completion",
+            choices=[{"index": 0, "message": {"role": "assistant", "content": self.report_text},
+                      "finish_reason": "stop"}],
+            usage={"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        ))
+
+
+def install_stubs(spotify: StubSpotify, openai_stub: Optional[StubOpenAI] = None):
+    """Point the backend's shared Spotify and OpenAI clients at the stubs"""
+    import openai
+    import openai_client
+    import spotify_client
+    from features_cache import get_audio_features_cache
+
+    import spotify_auth
+
+    spotify_client._client = spotify_client.SpotifyClient(
+        transport=httpx.MockTransport(spotify), features_cache=get_audio_features_cache()
+    )
+    spotify_auth._auth = spotify_auth.SpotifyAuth(transport=httpx.MockTransport(spotify))
+    if openai_stub is not None:
+        openai_client._client = openai.AsyncOpenAI(
+            api_key="stub", http_client=httpx.AsyncClient(transport=httpx.MockTransport(openai_stub))
+        )
@@ -0,0 +1,90 @@
+# synthetic.py
+"""
+Seeded synthetic playlists for benchmarks, in both shapes the backend
+consumes: Spotify API JSON (tracks + audio-features map) and the typed
+track DataFrame produced by create_dataframe_from_spotify_data.
+"""
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+PLAYLIST_SIZES = (100, 1_000, 10_000, 50_000)
+
+
+def _artist_picks(rng: np.random.Generator, n_tracks: int) -> np.ndarray:
+    # Zipf-like: a few artists dominate, with a long tail, like real playlists
+    n_artists = max(1, n_tracks // 8)
+    return np.minimum(rng.zipf(1.3, n_tracks) - 1, n_artists - 1)
+
+
+def make_spotify_playlist(n_tracks: int, seed: int = 42,
+                          prefix: str = "t") -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """
+    (tracks, audio_features_map) as returned by the Spotify client.
+
+    Track IDs are `prefix` + index, so playlists built with different
+    prefixes don't share tracks (or audio-features cache entries).
+    """
+    rng = np.random.default_rng(seed)
+    artists = _artist_picks(rng, n_tracks)
+    featured = rng.random(n_tracks) < 0.15
+    albums = rng.integers(0, max(1, n_tracks // 4), n_tracks)
+    popularity = rng.integers(0, 101, n_tracks)
+    duration = rng.integers(90_000, 420_000, n_tracks)
+    explicit = rng.random(n_tracks) < 0.3
+    features = rng.random((n_tracks, 7))
+    tempo = rng.uniform(60, 200, n_tracks)
+
+    tracks = []
+    audio_features_map = {}
+    for i in range(n_tracks):
+        track_id = f"{prefix}{i}"
+        track_artists = [{"id": f"artist{artists[i]}", "name": f"Artist {artists[i]}"}]
+        if featured[i]:
+            guest = (artists[i] + 1 + i) % max(1, n_tracks // 8)
+            track_artists.append({"id": f"artist{guest}", "name": f"Artist {guest}"})
+        tracks.append({
+            "id": track_id,
+            "name": f"Track {i}",
+            "artists": track_artists,
+            "album": {"name": f"Album {albums[i]}"},
+            "popularity": int(popularity[i]),
+            "duration_ms": int(duration[i]),
+            "explicit": bool(explicit[i]),
+        })
+        danceability, energy, valence, acousticness, instrumentalness, liveness, speechiness = features[i]
+        audio_features_map[track_id] = {
+            "id": track_id,
+            "danceability": float(danceability),
+            "energy": float(energy),
+            "valence": float(valence),
+            "acousticness": float(acousticness),
+            "instrumentalness": float(instrumentalness),
+            "liveness": float(liveness),
+            "speechiness": float(speechiness),
+            "tempo": float(tempo[i]),
+        }
+    return tracks, audio_features_map
+
+
+def make_playlist_df(n_tracks: int, seed: int = 42) -> pd.DataFrame:
+    """Synthetic playlist in the same shape as create_dataframe_from_spotify_data"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Track Name": [f"Track {i}" for i in range(n_tracks)],
+        "Artist Name(s)": [f"Artist {i}" for i in rng.integers(0, max(1, n_tracks // 8), n_tracks)],
+        "Album Name": [f"Album {i}" for i in rng.integers(0, max(1, n_tracks // 4), n_tracks)],
+        "Track ID": [f"{i:022d}" for i in range(n_tracks)],
+        "Popularity": rng.integers(0, 101, n_tracks).astype(float),
+        "Duration (ms)": rng.integers(90_000, 420_000, n_tracks).astype(float),
+        "Explicit": rng.random(n_tracks) < 0.3,
+        "Danceability": rng.random(n_tracks),
+        "Energy": rng.random(n_tracks),
+        "Valence": rng.random(n_tracks),
+        "Acousticness": rng.random(n_tracks),
+        "Instrumentalness": rng.random(n_tracks),
+        "Liveness": rng.random(n_tracks),
+        "Speechiness": rng.random(n_tracks),
+        "Tempo": rng.uniform(60, 200, n_tracks),
+    })
@@ -0,0 +1,108 @@
+# csv_stream.py
+import os
+from typing import IO, TYPE_CHECKING, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from stats_engine import PlaylistStats
+from track_schema import TRACK_COLUMNS
+
+if TYPE_CHECKING:
+    from analysis_pool import AnalysisTicket
+
+# Rows parsed per chunk; peak memory is roughly one chunk plus the reservoir
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "5000"))
+# Uniform sample of the file kept for diversity/random sampling
+CSV_RESERVOIR_SIZE = int(os.getenv("CSV_RESERVOIR_SIZE", "2000"))
+# Most popular tracks kept exactly, for the popularity share of the sample
+CSV_TOP_POPULAR = 40
+
+# Exportify exports carry many more columns (URIs, genres, added-at...);
+# only the ones the analysis reads are materialized
+_WANTED_COLUMNS = set(TRACK_COLUMNS)
+
+
+class TrackReservoir:
+    """
+    Bounded stand-in for the whole playlist when choosing the prompt sample.
+
+    Keeps a uniform random sample of `size` rows (each row gets a random key
+    and the smallest keys win, so chunks fold in without knowing the total)
+    plus the `top_popular` most popular rows, which a uniform sample would
+    usually miss.
+    """
+
+    def __init__(self, size: int = CSV_RESERVOIR_SIZE, top_popular: int = CSV_TOP_POPULAR, seed: int = 42):
+        self.size = size
+        self.top_popular = top_popular
+        self.rng = np.random.default_rng(seed)
+        self.rows_seen = 0
+        self._uniform: Optional[pd.DataFrame] = None
+        self._popular: Optional[pd.DataFrame] = None
+
+    def add(self, chunk: pd.DataFrame):
+        chunk = chunk.assign(
+            _row=np.arange(self.rows_seen, self.rows_seen + len(chunk)),
+            _key=self.rng.random(len(chunk)),
+        )
+        self.rows_seen += len(chunk)
+        self._uniform = _keep(self._uniform, chunk, self.size, lambda df: df.nsmallest(self.size, '_key'))
+        if 'Popularity' in chunk.columns:
+            chunk = chunk.assign(_popularity=pd.to_numeric(chunk['Popularity'], errors='coerce').fillna(0))
+            self._popular = _keep(self._popular, chunk, self.top_popular,
+                                  lambda df: df.nlargest(self.top_popular, '_popularity'))
+
+    def frame(self) -> pd.DataFrame:
+        """Kept rows in file order, without duplicates or bookkeeping columns"""
+        parts = [part for part in (self._popular, self._uniform) if part is not None]
+        if not parts:
+            return pd.DataFrame(columns=TRACK_COLUMNS)
+        kept = pd.concat(parts, ignore_index=True).drop_duplicates('_row').sort_values('_row')
+        return kept.drop(columns=[c for c in ('_row', '_key', '_popularity') if c in kept.columns]) \
+                   .reset_index(drop=True)
+
+
+def _keep(current: Optional[pd.DataFrame], chunk: pd.DataFrame, limit: int, select) -> pd.DataFrame:
+    combined = chunk if current is None else pd.concat([current, chunk], ignore_index=True)
+    return select(combined) if len(combined) > limit else combined
+
+
+def open_exportify_reader(file: IO, chunk_rows: int = CSV_CHUNK_ROWS):
+    """Chunked reader over an Exportify CSV, limited to the columns the analysis uses"""
+    return pd.read_csv(file, chunksize=chunk_rows, usecols=lambda column: column in _WANTED_COLUMNS)
+
+
+def fold_csv_chunk(stats: PlaylistStats, reservoir: TrackReservoir,
+                   chunk: pd.DataFrame) -> Tuple[PlaylistStats, TrackReservoir]:
+    """
+    Fold one parsed chunk into the running stats and sample; runs in the
+    analysis pool. Returns both, since a process pool works on copies.
+    """
+    stats.merge(PlaylistStats.from_dataframe(chunk))
+    reservoir.add(chunk)
+    return stats, reservoir
+
+
+async def fold_exportify_csv(file: IO, ticket: "AnalysisTicket", chunk_rows: int = CSV_CHUNK_ROWS,
+                             reservoir_size: int = CSV_RESERVOIR_SIZE) -> Tuple[PlaylistStats, pd.DataFrame]:
+    """
+    Stream an Exportify CSV into exact running statistics and a bounded
+    sample frame, one chunk at a time. Parsing and folding run under the
+    caller's analysis-pool `ticket`, never on the event loop; memory stays
+    bounded by the chunk and reservoir sizes, not the file.
+    """
+    # The reader wraps the open upload, so parsing stays in this process
+    reader = await ticket.run_local(open_exportify_reader, file, chunk_rows)
+    stats = PlaylistStats()
+    reservoir = TrackReservoir(reservoir_size)
+    try:
+        while True:
+            # next() with a default: StopIteration can't cross into a Future
+            chunk = await ticket.run_local(next, reader, None)
+            if chunk is None:
+                break
+            stats, reservoir = await ticket.run(fold_csv_chunk, stats, reservoir, chunk)
+    finally:
+        reader.close()
+    return stats, await ticket.run(reservoir.frame)
@@ -0,0 +1,179 @@
+# features_cache.py
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+# SQLite caps the number of bound parameters per statement
+_SQLITE_IN_CHUNK = 500
+
+# How often put_many deletes expired rows from the disk tier
+_PURGE_INTERVAL_SECONDS = 3600
+
+
+class AudioFeaturesCache:
+    """
+    Two-tier audio-features cache keyed by Spotify track ID.
+
+    Tier 1 is an in-process LRU bounded by `max_entries`. Tier 2 is a SQLite
+    file (WAL + mmap) that survives restarts and is shared by every uvicorn
+    worker pointing at the same path. Audio features for a track never
+    change, so entries only leave the disk tier when `max_age_days` is hit;
+    expired rows are purged at most once an hour, on write.
+
+    Tracks Spotify has no features for are cached too, as None, so they
+    aren't requested again on every lookup. Those expire after
+    `negative_max_age_days`, in case Spotify analyzes the track later.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, db_path: Optional[str] = None,
+                 max_age_days: Optional[float] = None, negative_max_age_days: Optional[float] = None):
+        if max_entries is None:
+            max_entries = int(os.getenv("AUDIO_FEATURES_CACHE_SIZE", "50000"))
+        if db_path is None:
+            db_path = os.getenv("AUDIO_FEATURES_CACHE_PATH", "./audio_features_cache.sqlite3")
+        if max_age_days is None:
+            max_age_days = float(os.getenv("AUDIO_FEATURES_CACHE_MAX_AGE_DAYS", "90"))
+        if negative_max_age_days is None:
+            negative_max_age_days = float(os.getenv("AUDIO_FEATURES_CACHE_NEGATIVE_MAX_AGE_DAYS", "7"))
+
+        self.max_entries = max(0, max_entries)
+        self.max_age_seconds = max_age_days * 86400
+        self.negative_max_age_seconds = min(negative_max_age_days, max_age_days) * 86400
+        self._memory: "OrderedDict[str, Optional[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.api_calls_saved = 0
+        self.purged = 0
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5.0)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("PRAGMA mmap_size=268435456")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS audio_features ("
+                "track_id TEXT PRIMARY KEY, features TEXT NOT NULL, fetched_at REAL NOT NULL)"
+            )
+            # Lets the purge find expired rows without a full scan
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS audio_features_fetched_at ON audio_features (fetched_at)"
+            )
+            self._db.commit()
+
+    def _remember(self, track_id: str, features: Optional[Dict[str, Any]]):
+        if self.max_entries == 0:
+            return
+        self._memory[track_id] = features
+        self._memory.move_to_end(track_id)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, track_ids: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Return cached entries for whichever of `track_ids` are known; None
+        means Spotify has no features for that track
+        """
+        found = {}
+        missing = []
+        with self._lock:
+            for track_id in track_ids:
+                if track_id in self._memory:
+                    self._memory.move_to_end(track_id)
+                    found[track_id] = self._memory[track_id]
+                else:
+                    missing.append(track_id)
+            memory_hits = len(found)
+
+            if missing and self._db is not None:
+                now = time.time()
+                for i in range(0, len(missing), _SQLITE_IN_CHUNK):
+                    chunk = missing[i:i + _SQLITE_IN_CHUNK]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = self._db.execute(
+                        f"SELECT track_id, features FROM audio_features "
+                        f"WHERE track_id IN ({placeholders}) "
+                        f"AND fetched_at >= CASE features WHEN 'null' THEN ? ELSE ? END",
+                        (*chunk, now - self.negative_max_age_seconds, now - self.max_age_seconds),
+                    ).fetchall()
+                    for track_id, payload in rows:
+                        features = json.loads(payload)
+                        found[track_id] = features
+                        self._remember(track_id, features)
+
+            self.memory_hits += memory_hits
+            self.disk_hits += len(found) - memory_hits
+        return found
+
+    def put_many(self, features_by_id: Dict[str, Optional[Dict[str, Any]]]):
+        """Store freshly fetched features (None for tracks without any) in both tiers"""
+        if not features_by_id:
+            return
+        now = time.time()
+        with self._lock:
+            for track_id, features in features_by_id.items():
+                self._remember(track_id, features)
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO audio_features (track_id, features, fetched_at) VALUES (?, ?, ?)",
+                    [(track_id, json.dumps(features), now) for track_id, features in features_by_id.items()],
+                )
+                if now - self._purged_at >= _PURGE_INTERVAL_SECONDS:
+                    self._purge(now)
+                self._db.commit()
+
+    def _purge(self, now: float):
+        """Delete rows get_many would no longer return; call with the lock held"""
+        self._purged_at = now
+        self.purged += self._db.execute(
+            # Negative entries expire first, so one range over the index covers both
+            "DELETE FROM audio_features WHERE fetched_at < ? AND (features = 'null' OR fetched_at < ?)",
+            (now - self.negative_max_age_seconds, now - self.max_age_seconds),
+        ).rowcount
+
+    def record_lookup(self, requested: int, missed: int, batch_size: int):
+        """Account for one playlist lookup: misses and the API calls the hits saved"""
+        with self._lock:
+            self.misses += missed
+            self.api_calls_saved += math.ceil(requested / batch_size) - math.ceil(missed / batch_size)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "max_memory_entries": self.max_entries,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": hits / lookups if lookups else 0.0,
+                "api_calls_saved": self.api_calls_saved,
+                "purged_entries": self.purged,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+_cache: Optional[AudioFeaturesCache] = None
+
+
+def get_audio_features_cache() -> AudioFeaturesCache:
+    """Process-wide cache instance"""
+    global _cache
+    if _cache is None:
+        _cache = AudioFeaturesCache()
+    return _cache
@@ -0,0 +1,121 @@
+# light_analysis.py
+import math
+import os
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+from track_schema import ARTISTS_COLUMN, AUDIO_FEATURE_COLUMNS, artist_set, safe_number
+
+# analyze_playlist_data samples at most this many tracks for the prompt
+SAMPLE_SIZE = 100
+
+# Playlists up to this size skip pandas/NumPy entirely. Capped at the sample
+# size: at or below it the strategic sample is the whole playlist, so no
+# sampling is needed and the result matches the DataFrame path.
+FAST_PATH_MAX_TRACKS = min(int(os.getenv("ANALYSIS_FAST_PATH_MAX_TRACKS", str(SAMPLE_SIZE))), SAMPLE_SIZE)
+
+SAMPLE_FEATURES = ['Danceability', 'Energy', 'Valence', 'Acousticness']
+
+
+def is_small_playlist(tracks: List[Dict[str, Any]]) -> bool:
+    return len(tracks) <= FAST_PATH_MAX_TRACKS
+
+
+def analyze_small_playlist(tracks: List[Dict[str, Any]], audio_features_map: Dict[str, Dict[str, Any]],
+                           playlist_name: str) -> Dict[str, Any]:
+    """
+    Same payload as analyze_playlist_data, computed from the raw Spotify
+    objects with plain Python, for playlists no bigger than the sample.
+    Avoids importing pandas/NumPy on a serverless cold start.
+    """
+    rows = _rows(tracks, audio_features_map)
+    return {
+        "playlist_name": playlist_name,
+        "basic_analysis": basic_analysis_from_rows(rows),
+        "track_samples": [_format_sample(row) for row in rows],
+        "total_tracks": len(rows),
+        "analyzed_tracks": len(rows),
+    }
+
+
+def basic_analysis_from_rows(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """The generate_basic_analysis metrics over rows shaped like the Exportify columns"""
+    # Each credited artist counts once per track, keyed by artist ID
+    artist_counts: Counter = Counter()
+    artist_names: Dict[str, str] = {}
+    for row in rows:
+        for key, name in row[ARTISTS_COLUMN]:
+            artist_counts[key] += 1
+            artist_names.setdefault(key, name)
+    album_counts = Counter(row["Album Name"] for row in rows)
+    popularity = [row["Popularity"] for row in rows]
+    durations = [row["Duration (ms)"] for row in rows]
+
+    analysis = {
+        "track_count": len(rows),
+        "artists_count": len(artist_counts),
+        "albums_count": len(album_counts),
+        "avg_popularity": _mean(popularity),
+        "duration_minutes": math.fsum(durations) / 60000,
+        "explicit_ratio": _mean([1.0 if row["Explicit"] else 0.0 for row in rows]),
+    }
+    for column, _ in AUDIO_FEATURE_COLUMNS:
+        values = [row[column] for row in rows]
+        analysis[f'avg_{column.lower()}'] = _mean(values)
+        analysis[f'std_{column.lower()}'] = _sample_std(values)
+
+    # Ties keep first-appearance order, like Series.nlargest on the exploded counts
+    top_artists: Dict[str, int] = {}
+    for key, count in sorted(artist_counts.items(), key=lambda item: -item[1])[:10]:
+        top_artists[artist_names[key]] = top_artists.get(artist_names[key], 0) + count
+    analysis['top_artists'] = top_artists
+    return analysis
+
+
+def _rows(tracks: List[Dict[str, Any]], audio_features_map: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Tracks as dicts keyed by Exportify column, with the same defaults as TrackTable.from_spotify"""
+    rows = []
+    for track in tracks:
+        if not track or not track.get('id'):
+            continue
+        album = track.get('album')
+        artists = artist_set(track)
+        row = {
+            "Track Name": track.get('name', ''),
+            "Artist Name(s)": ", ".join(name for _, name in artists),
+            ARTISTS_COLUMN: artists,
+            "Album Name": album.get('name', '') if isinstance(album, dict) else '',
+            "Track ID": track['id'],
+            "Popularity": int(safe_number(track.get('popularity'))),
+            "Duration (ms)": int(safe_number(track.get('duration_ms'))),
+            "Explicit": bool(track.get('explicit', False)),
+        }
+        track_features = audio_features_map.get(track['id']) or {}
+        for column, key in AUDIO_FEATURE_COLUMNS:
+            row[column] = safe_number(track_features.get(key))
+        rows.append(row)
+    return rows
+
+
+def _format_sample(row: Dict[str, Any]) -> Dict[str, Any]:
+    """format_track_samples for one row"""
+    sample = {
+        "name": row["Track Name"],
+        "artist": row["Artist Name(s)"],
+        "popularity": row["Popularity"],
+    }
+    for feature in SAMPLE_FEATURES:
+        sample[feature.lower()] = row[feature]
+    return sample
+
+
+def _mean(values: List[float]) -> float:
+    return math.fsum(values) / len(values) if values else 0
+
+
+def _sample_std(values: List[float]) -> float:
+    # ddof=1, matching pandas
+    if len(values) < 2:
+        return 0
+    mean = _mean(values)
+    return math.sqrt(math.fsum((value - mean) ** 2 for value in values) / (len(values) - 1))
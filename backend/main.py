@@ -1,29 +1,85 @@
 # main.py
+from __future__ import annotations
+
 import os
+import sys
+import logging
+import time
 from dotenv import load_dotenv
-import pandas as pd
-from fastapi import FastAPI, HTTPException, Header
+from fastapi import FastAPI, File, Form, HTTPException, Header, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-import requests
-from fastapi import File, UploadFile
-from analysis_engine import analyze_playlist_data
-from ai_prompter import generate_vibe_report
-from typing import List, Dict
-import httpx
-from http.server import BaseHTTPRequestHandler
-
-class handler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        self.send_response(200)
-        self.send_header('Content-type', 'text/plain')
-        self.end_headers()
-        return
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from ai_prompter import ReportOutcome, generate_vibe_report, stream_vibe_report
+from typing import TYPE_CHECKING, Callable, Dict, Tuple
+from contextlib import asynccontextmanager
+from report_cache import get_report_cache
+from analysis_pool import AnalysisPoolFull, get_analysis_pool, close_analysis_pool
+from analysis_state import PlaylistState, diff_track_ids, get_analysis_state_store, select_removed_rows
+from light_analysis import analyze_small_playlist, is_small_playlist
+from track_schema import ARTISTS_COLUMN
+import asyncio
+import json
+from openai_client import close_openai_client
+from metrics import REQUEST_SECONDS, TRACKS_PROCESSED, register_collector, render_metrics, stage
+
+# pandas/NumPy (analysis engine), httpx (Spotify client and auth) and openai
+# are imported inside the functions that use them: a serverless cold start
+# for /health or a small playlist shouldn't pay hundreds of ms to load them.
+# benchmarks/bench_import_time.py keeps this honest.
+if TYPE_CHECKING:
+    from collections import Counter
+
+    import pandas as pd
+    from spotify_auth import SpotifyAuthError
+    from spotify_client import FetchReport
+    from stats_engine import PlaylistStats
 
 # loading .env
 load_dotenv(dotenv_path="./.env")
 
+# LOG_LEVEL=DEBUG brings back the per-request payload dumps
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+# httpx logs every upstream request at INFO; the Spotify counters cover that
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+def loaded_stats(module_name: str, getter: str) -> Callable[[], Dict]:
+    """stats() of a component, or nothing if its module hasn't been imported yet"""
+    def collect() -> Dict:
+        module = sys.modules.get(module_name)
+        return getattr(module, getter)().stats() if module is not None else {}
+    return collect
+
+# Component counters are exported as gauges on /metrics at scrape time;
+# scraping never imports a component just to report zeros
+register_collector("spotify", loaded_stats("spotify_client", "get_spotify_client"))
+register_collector("audio_features_cache", loaded_stats("features_cache", "get_audio_features_cache"))
+register_collector("report_cache", lambda: get_report_cache().stats())
+register_collector("analysis_pool", lambda: get_analysis_pool().stats())
+register_collector("analysis_store", loaded_stats("analysis_store", "get_playlist_analysis_store"))
+register_collector("spotify_auth", loaded_stats("spotify_auth", "get_spotify_auth"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The Spotify API and auth clients, OpenAI client and analysis pool are
+    # process-wide singletons created on first use, so startup stays cheap
+    yield
+    if "spotify_auth" in sys.modules:
+        await sys.modules["spotify_auth"].close_spotify_auth()
+    if "spotify_client" in sys.modules:
+        await sys.modules["spotify_client"].close_spotify_client()
+    await close_openai_client()
+    close_analysis_pool()
+
+# Set on analysis responses when the caller's token was refreshed server-side;
+# the client should use these tokens from then on (Spotify may rotate the
+# refresh token, and the old one stops working)
+REFRESHED_TOKEN_HEADER = "X-Spotify-Access-Token"
+REFRESHED_REFRESH_TOKEN_HEADER = "X-Spotify-Refresh-Token"
+
 # This line is crucial - it creates the FastAPI instance named 'app'
-app = FastAPI(title="Playlist Vibe Check API")
+app = FastAPI(title="Playlist Vibe Check API", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -32,8 +88,44 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[REFRESHED_TOKEN_HEADER, REFRESHED_REFRESH_TOKEN_HEADER],
 )
 
+@app.middleware("http")
+async def observe_request_latency(request: Request, call_next):
+    """
+    Request latency by route template, so playlist IDs don't explode the
+    label set. Timed until the last body chunk is sent, not until the
+    headers are, so streaming routes report their full duration.
+    """
+    started_at = time.perf_counter()
+
+    def observe(status: int):
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - started_at,
+            method=request.method,
+            route=route.path if route is not None else "unmatched",
+            status=str(status),
+        )
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        observe(500)
+        raise
+    body_iterator = response.body_iterator
+
+    async def timed_body():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            observe(response.status_code)
+
+    response.body_iterator = timed_body()
+    return response
+
 # begin of backend connection test
 @app.get("/")
 async def root():
@@ -47,218 +139,688 @@ async def test_route():
 async def health_check():
     return {"status": "healthy", "message": "Backend is running", "timestamp": "2024-01-01T00:00:00Z"}
 
+@app.get("/cache/audio-features")
+async def audio_features_cache_stats():
+    """Hit/miss counters for the cross-request audio-features cache"""
+    from features_cache import get_audio_features_cache
+    return get_audio_features_cache().stats()
+
+@app.get("/cache/reports")
+async def report_cache_stats():
+    """Hit/miss/coalesced counters for the vibe-report cache"""
+    return get_report_cache().stats()
+
+@app.get("/spotify/stats")
+async def spotify_client_stats():
+    """Request, retry and rate-limit counters for the Spotify transport"""
+    from spotify_client import get_spotify_client
+    return get_spotify_client().stats()
+
+@app.get("/pool/analysis")
+async def analysis_pool_stats():
+    """Queue depth, wait time and rejections for the analysis worker pool"""
+    return get_analysis_pool().stats()
+
+@app.get("/metrics")
+async def metrics():
+    """Stage latencies, request latencies and component counters for Prometheus"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # end of backend connection test
 
 # spotify auth
 @app.post("/api/exchange-token")
 async def exchange_token(data: dict):
-    print("here")
+    """Authorization code from the OAuth callback -> Spotify access and refresh tokens"""
+    from spotify_auth import SpotifyAuthError, get_spotify_auth
     code = data.get('code')
-    # Use the 'requests' library to call Spotify's token endpoint
-    response = requests.post(
-        'https://accounts.spotify.com/api/token',
-        data={
-            'grant_type': 'authorization_code',
-            'code': code,
-            'redirect_uri': 'http://127.0.0.1:3000/api/auth/callback',
-            'client_id': os.getenv("SPOTIFY_CLIENT_ID"),
-            'client_secret': os.getenv("SPOTIFY_CLIENT_SECRET")
+    if not code:
+        raise HTTPException(status_code=400, detail="Missing authorization code")
+    try:
+        return await get_spotify_auth().exchange_code(code)  # Returns access_token and refresh_token to the frontend
+    except SpotifyAuthError as e:
+        raise auth_failed(e)
+
+@app.post("/api/refresh-token")
+async def refresh_token(data: dict):
+    """Refresh token -> a new access token (and refresh token, if Spotify rotated it)"""
+    from spotify_auth import SpotifyAuthError, get_spotify_auth
+    token = data.get('refresh_token')
+    if not token:
+        raise HTTPException(status_code=400, detail="Missing refresh token")
+    try:
+        return await get_spotify_auth().refresh(token)
+    except SpotifyAuthError as e:
+        raise auth_failed(e)
+
+@app.get("/spotify/auth/stats")
+async def spotify_auth_stats():
+    """Token exchanges, refreshes, validations and rejections"""
+    from spotify_auth import get_spotify_auth
+    return get_spotify_auth().stats()
+
+def auth_failed(e: SpotifyAuthError) -> HTTPException:
+    logger.warning("❌ Spotify auth: %s", e)
+    return HTTPException(status_code=e.status_code, detail=e.detail)
+
+def get_access_token(authorization: str) -> str:
+    """Extract the bearer token from the Authorization header, or 401"""
+    if not authorization or not authorization.startswith("Bearer "):
+        logger.warning("❌ Missing or invalid authorization header")
+        raise HTTPException(status_code=401, detail="Missing access token")
+    return authorization.split(" ")[1]
+
+async def validated_access_token(authorization: str) -> Tuple[str, Dict[str, str]]:
+    """
+    The bearer token, checked before any multi-page fetch starts and swapped
+    for a refreshed one if it's about to expire, plus the response headers
+    that hand a refreshed token pair back to the client.
+    """
+    from spotify_auth import SpotifyAuthError, get_spotify_auth
+    access_token = get_access_token(authorization)
+    try:
+        access_token, session = await get_spotify_auth().ensure_valid(access_token)
+    except SpotifyAuthError as e:
+        raise auth_failed(e)
+    except Exception as e:
+        raise analysis_failed(e)
+    if session is None:
+        return access_token, {}
+    return access_token, {REFRESHED_TOKEN_HEADER: access_token,
+                          REFRESHED_REFRESH_TOKEN_HEADER: session.refresh_token}
+
+async def prepare_playlist_analysis(access_token: str, playlist_id: str) -> Dict:
+    """
+    Everything up to (but not including) the AI report.
+
+    Returns {"stored_response": ...} when the snapshot is unchanged, otherwise
+    the pieces needed to build and persist the response.
+    """
+    from spotify_client import FetchReport, get_spotify_client
+    client = get_spotify_client()
+    store = get_analysis_state_store()
+    
+    # 1. One metadata call tells us whether the playlist changed since last time
+    snapshot = await client.get_playlist_snapshot(access_token, playlist_id)
+    snapshot_id = snapshot.get('snapshot_id')
+    playlist_name = snapshot['name']
+    if snapshot_id:
+        stored_response = await asyncio.to_thread(store.load_response, playlist_id, snapshot_id)
+        if stored_response is not None:
+            logger.info("✅ Snapshot %s unchanged, returning stored analysis", snapshot_id)
+            stored_response["analysis_metadata"]["from_snapshot_cache"] = True
+            return {"stored_response": stored_response}
+    
+    # 2. Get playlist data from Spotify: diff against the stored state if
+    #    there is one, otherwise fetch everything
+    fetch_report = FetchReport()
+    state = await asyncio.to_thread(store.load, playlist_id)
+    incremental = state is not None and state.tracks is not None
+    df = stats = changes = analysis_data = None
+    if incremental:
+        # Also taken for an unchanged snapshot whose stored report failed
+        logger.info("🔍 Updating stored state incrementally (%s -> %s)", state.snapshot_id, snapshot_id)
+        playlist_changes = await fetch_playlist_changes(access_token, playlist_id, state, fetch_report)
+    else:
+        logger.info("🔍 Fetching playlist data for: %s", playlist_id)
+        _, tracks, audio_features_map = await get_playlist_from_spotify(access_token, playlist_id, fetch_report,
+                                                                        playlist_data=snapshot)
+        if is_small_playlist(tracks):
+            # The whole playlist fits in the prompt sample: plain Python, no pandas
+            logger.info("✅ Got playlist: %s with %d tracks (fast path)", playlist_name, len(tracks))
+            TRACKS_PROCESSED.inc(len(tracks))
+            with stage("statistics"):
+                analysis_data = analyze_small_playlist(tracks, audio_features_map, playlist_name)
+    
+    # 3. Analyze the data using your existing engine, off the event loop.
+    #    Admitted once, so the second stage can't be turned away after the first
+    if analysis_data is None:
+        with get_analysis_pool().admit() as ticket:
+            if incremental:
+                df, stats, changes = await ticket.run(apply_playlist_changes, state, *playlist_changes)
+            else:
+                # Convert to DataFrame (same format as Exportify CSV)
+                df = await ticket.run(create_dataframe_from_spotify_data, tracks, audio_features_map)
+            logger.info("✅ Got playlist: %s with %d tracks", playlist_name, len(df))
+            logger.debug("🔍 Starting analysis...")
+            stats, analysis_data = await ticket.run(analyze_playlist_stage, df, playlist_name, stats)
+            logger.debug("✅ Analysis completed")
+    
+    return {
+        "stored_response": None,
+        "playlist_id": playlist_id,
+        "playlist_name": playlist_name,
+        "snapshot_id": snapshot_id,
+        "snapshot": snapshot,
+        "df": df,
+        "stats": stats,
+        "changes": changes,
+        "fetch_report": fetch_report,
+        "analysis_data": analysis_data,
+    }
+
+def build_analysis_response(prepared: Dict, ai_report: str) -> Dict:
+    """Response body with safe values"""
+    analysis_data = prepared["analysis_data"]
+    return {
+        "playlist_name": prepared["playlist_name"],
+        "quantitative_analysis": analysis_data["basic_analysis"],
+        "ai_vibe_report": ai_report,
+        "analysis_metadata": {
+            "total_tracks": analysis_data["total_tracks"],
+            "tracks_analyzed": analysis_data["analyzed_tracks"],
+            "snapshot_id": prepared["snapshot_id"],
+            "incremental_update": prepared["changes"],
+            "spotify_fetch": prepared["fetch_report"].as_dict(),
         }
+    }
+
+async def save_playlist_state(prepared: Dict, response_data: Dict, report_ok: bool):
+    """Persist the state so the next request can reuse or diff against it"""
+    # A partial fetch has zeroed features baked into its aggregates; don't
+    # let later requests reuse or build on it
+    if not prepared["fetch_report"].as_dict()["complete"]:
+        return
+    if prepared["snapshot_id"]:
+        # A fallback message instead of a report isn't worth replaying: keep
+        # the tracks and aggregates, but no response, so the next request
+        # on this snapshot regenerates the report
+        await asyncio.to_thread(
+            get_analysis_state_store().save,
+            PlaylistState(prepared["playlist_id"], prepared["snapshot_id"], response_data if report_ok else None,
+                          prepared["df"], prepared["stats"])
+        )
+    await save_playlist_analysis(prepared["playlist_id"], prepared["snapshot"],
+                                 response_data["quantitative_analysis"])
+
+async def save_playlist_analysis(playlist_id: str, snapshot: Dict, basic_analysis: Dict):
+    """Add the analysis to the similar-playlists index, with its owner and visibility"""
+    from analysis_store import get_playlist_analysis_store
+    await asyncio.to_thread(
+        get_playlist_analysis_store().save, playlist_id, snapshot['name'], basic_analysis,
+        (snapshot.get('owner') or {}).get('id'), bool(snapshot.get('public')),
     )
-    token_data = response.json()
-    return token_data # Returns access_token and refresh_token to the frontend
+
+def analyze_playlist_stage(df: pd.DataFrame, playlist_name: str, stats: PlaylistStats = None):
+    """CPU-bound part of the pipeline (stats, sampling); runs in the analysis pool"""
+    from stats_engine import PlaylistStats
+    TRACKS_PROCESSED.inc(len(df))
+    if stats is None:
+        with stage("statistics"):
+            stats = PlaylistStats.from_dataframe(df)
+    return stats, analyze_playlist_from_dataframe(df, playlist_name, stats)
+
+def fold_page_stage(stats: PlaylistStats, tracks: list, audio_features_map: dict):
+    """
+    Fold one progressive page into the running stats; runs in the analysis
+    pool. Returns the stats too, since a process pool works on a copy.
+    """
+    from stats_engine import PlaylistStats
+    page_df = create_dataframe_from_spotify_data(tracks, audio_features_map)
+    stats.merge(PlaylistStats.from_dataframe(page_df))
+    return stats, page_df, stats.finalize()
+
+def assemble_pages_stage(pages: list, playlist_name: str, stats: PlaylistStats):
+    """The progressive pages as one DataFrame, then analyze_playlist_stage; runs in the analysis pool"""
+    # Pages arrive out of order; put the playlist back together in order
+    df = concat_track_frames([page_df for _, page_df in sorted(pages, key=lambda page: page[0])])
+    return (df, *analyze_playlist_stage(df, playlist_name, stats))
+
+def pool_full(e: AnalysisPoolFull) -> HTTPException:
+    logger.warning("❌ %s", e)
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def analysis_failed(e: Exception) -> HTTPException:
+    import httpx
+    from spotify_client import parse_retry_after
+    if isinstance(e, httpx.HTTPStatusError) and e.response.status_code in (401, 403, 404, 429):
+        # Pass Spotify's own verdict through instead of turning it into a 500
+        status = e.response.status_code
+        logger.warning("❌ Spotify returned %d for %s", status, e.request.url.path)
+        headers = None
+        if status == 429:
+            headers = {"Retry-After": str(int(parse_retry_after(e.response.headers.get("Retry-After"))) or 1)}
+        return HTTPException(status_code=status, detail=f"Spotify API error: {status}", headers=headers)
+    logger.error("❌ Analysis error (%s): %s", type(e).__name__, e, exc_info=e)
+    return HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
 @app.post("/analyze/playlist/{playlist_id}")
-async def analyze_playlist_direct(playlist_id: str, authorization: str = Header(None)):
-    print("got here")
+async def analyze_playlist_direct(playlist_id: str, response: Response, authorization: str = Header(None)):
     """
     Analyze a playlist directly from Spotify API (no CSV needed)
     """
-    print(f"🔍 Received analysis request for playlist: {playlist_id}")
-    print(f"🔍 Authorization header: {authorization}")
-    
-    if not authorization or not authorization.startswith("Bearer "):
-        print("❌ Missing or invalid authorization header")
-        raise HTTPException(status_code=401, detail="Missing access token")
-    
-    access_token = authorization.split(" ")[1]
-    print(f"🔍 Extracted access token: {access_token[:20]}...")
+    logger.info("🔍 Received analysis request for playlist: %s", playlist_id)
+    access_token, auth_headers = await validated_access_token(authorization)
+    response.headers.update(auth_headers)
     
     try:
-        # 1. Get playlist data from Spotify
-        print(f"🔍 Fetching playlist data for: {playlist_id}")
-        playlist_data, df = await get_playlist_from_spotify(access_token, playlist_id)
-        playlist_name = playlist_data['name']
-        print(f"✅ Got playlist: {playlist_name} with {len(df)} tracks")
+        prepared = await prepare_playlist_analysis(access_token, playlist_id)
+        if prepared["stored_response"] is not None:
+            return prepared["stored_response"]
         
-        # 2. Analyze the data using your existing engine
-        print("🔍 Starting analysis...")
-        analysis_data = analyze_playlist_from_dataframe(df, playlist_name)
-        print("✅ Analysis completed")
+        # 4. Generate AI report
+        logger.debug("🔍 Generating AI report...")
+        ai_report, report_ok = await generate_vibe_report(prepared["analysis_data"])
+        logger.debug("✅ AI report generated")
         
-        # 3. Generate AI report
-        print("🔍 Generating AI report...")
-        ai_report = generate_vibe_report(analysis_data)
-        print("✅ AI report generated")
+        # 5. Prepare response and persist state
+        response_data = build_analysis_response(prepared, ai_report)
+        await save_playlist_state(prepared, response_data, report_ok)
         
-        # 4. Prepare response with safe values
-        response_data = {
-            "playlist_name": playlist_name,
-            "quantitative_analysis": analysis_data["basic_analysis"],
-            "ai_vibe_report": ai_report,
-            "analysis_metadata": {
-                "total_tracks": analysis_data["total_tracks"],
-                "tracks_analyzed": analysis_data["analyzed_tracks"]
-            }
-        }
-        
-        print("✅ Response prepared successfully")
+        logger.debug("✅ Response prepared successfully")
         return response_data
         
+    except HTTPException:
+        raise
+    except AnalysisPoolFull as e:
+        raise pool_full(e)
     except Exception as e:
-        print(f"❌ Analysis error: {str(e)}")
-        print(f"❌ Error type: {type(e).__name__}")
-        import traceback
-        print(f"❌ Traceback: {traceback.format_exc()}")
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
-
-async def get_playlist_from_spotify(access_token: str, playlist_id: str):
-    """Get playlist data from Spotify API and convert to DataFrame"""
-    headers = {"Authorization": f"Bearer {access_token}"}
+        raise analysis_failed(e)
+
+@app.post("/analyze/playlist/{playlist_id}/stream")
+async def analyze_playlist_stream(playlist_id: str, authorization: str = Header(None)):
+    """
+    Same analysis as /analyze/playlist/{playlist_id}, streamed as NDJSON:
+    the quantitative analysis is sent as soon as it's ready, followed by
+    the vibe report tokens as the model produces them.
     
-    async with httpx.AsyncClient() as client:
-        # Get playlist metadata
-        playlist_response = await client.get(
-            f"https://api.spotify.com/v1/playlists/{playlist_id}",
-            headers=headers
-        )
-        playlist_response.raise_for_status()
-        playlist_data = playlist_response.json()
+    Lines: {"type": "analysis", ...}, {"type": "report_delta", "text": ...}*, {"type": "done"}
+    """
+    logger.info("🔍 Received streaming analysis request for playlist: %s", playlist_id)
+    access_token, auth_headers = await validated_access_token(authorization)
+    
+    # Errors before the first byte still surface as proper HTTP errors
+    try:
+        prepared = await prepare_playlist_analysis(access_token, playlist_id)
+    except AnalysisPoolFull as e:
+        raise pool_full(e)
+    except Exception as e:
+        raise analysis_failed(e)
+    
+    async def events():
+        stored = prepared["stored_response"]
+        if stored is not None:
+            yield ndjson_line({"type": "analysis", **{k: v for k, v in stored.items() if k != "ai_vibe_report"}})
+            yield ndjson_line({"type": "report_delta", "text": stored["ai_vibe_report"]})
+            yield ndjson_line({"type": "done"})
+            return
         
-        # Get all tracks with pagination
-        all_tracks = []
-        tracks_url = f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks?limit=100"
+        preview = build_analysis_response(prepared, None)
+        del preview["ai_vibe_report"]
+        yield ndjson_line({"type": "analysis", **preview})
         
-        while tracks_url:
-            tracks_response = await client.get(tracks_url, headers=headers)
-            tracks_response.raise_for_status()
-            tracks_data = tracks_response.json()
-            
-            # Extract track objects
-            for item in tracks_data['items']:
-                if item['track']:  # Skip null tracks
-                    all_tracks.append(item['track'])
-            
-            tracks_url = tracks_data.get('next')
+        report_parts = []
+        outcome = ReportOutcome()
+        async for delta in stream_vibe_report(prepared["analysis_data"], outcome):
+            report_parts.append(delta)
+            yield ndjson_line({"type": "report_delta", "text": delta})
         
-        # Get audio features in batches
-        track_ids = [track['id'] for track in all_tracks if track.get('id')]
-        audio_features_map = {}
+        await save_playlist_state(prepared, build_analysis_response(prepared, "".join(report_parts).strip()),
+                                  outcome.ok)
+        yield ndjson_line({"type": "done"})
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson", headers=auth_headers)
+
+@app.post("/analyze/playlist/{playlist_id}/progressive")
+async def analyze_playlist_progressive(playlist_id: str, authorization: str = Header(None)):
+    """
+    Pipelined analysis streamed as NDJSON while pages are still downloading.
+    
+    Each track page is converted, joined with its audio features and folded
+    into running statistics as soon as it arrives, so fetching and computing
+    overlap and the first numbers go out after one round trip.
+    
+    Lines: {"type": "progress", ...}*, {"type": "analysis", ...},
+           {"type": "report_delta", "text": ...}*, {"type": "done"}
+    """
+    logger.info("🔍 Received progressive analysis request for playlist: %s", playlist_id)
+    access_token, auth_headers = await validated_access_token(authorization)
+    
+    from spotify_client import FetchReport, get_spotify_client
+    from stats_engine import PlaylistStats
+    client = get_spotify_client()
+    try:
+        snapshot = await client.get_playlist_snapshot(access_token, playlist_id)
+    except Exception as e:
+        raise analysis_failed(e)
+    snapshot_id = snapshot.get('snapshot_id')
+    
+    async def events():
+        if snapshot_id:
+            stored = await asyncio.to_thread(get_analysis_state_store().load_response, playlist_id, snapshot_id)
+            if stored is not None:
+                stored["analysis_metadata"]["from_snapshot_cache"] = True
+                yield ndjson_line({"type": "analysis", **{k: v for k, v in stored.items() if k != "ai_vibe_report"}})
+                yield ndjson_line({"type": "report_delta", "text": stored["ai_vibe_report"]})
+                yield ndjson_line({"type": "done"})
+                return
         
-        for i in range(0, len(track_ids), 100):
-            batch_ids = track_ids[i:i+100]
-            print(f"🔍 Fetching audio features for batch {i//100 + 1}, track IDs: {batch_ids[:3]}...")
-            features_response = await client.get(
-                f"https://api.spotify.com/v1/audio-features?ids={','.join(batch_ids)}",
-                headers=headers
-            )
-            print(f"🔍 Audio features response status: {features_response.status_code}")
-            if features_response.status_code == 200:
-                features_data = features_response.json()
-                print(f"🔍 Got {len(features_data.get('audio_features', []))} audio features")
-                for feature in features_data.get('audio_features', []):
-                    if feature:
-                        audio_features_map[feature['id']] = feature
-                        print("audio_features_map")
-                        print(audio_features_map)
-                        print(f"🔍 Sample audio feature for {feature['id']}: danceability={feature.get('danceability')}, energy={feature.get('energy')}")
-            else:
-                print(f"❌ Failed to fetch audio features: {features_response.status_code}")
+        stats = PlaylistStats()
+        pages = []
+        fetch_report = FetchReport()
+        try:
+            # Admitted once up front: every page is folded in the pool, and
+            # pages keep downloading while one is being folded
+            with get_analysis_pool().admit() as ticket:
+                async for offset, total, tracks, audio_features_map in client.iter_playlist_pages(
+                    access_token, playlist_id, fetch_report
+                ):
+                    stats, page_df, running_analysis = await ticket.run(
+                        fold_page_stage, stats, tracks, audio_features_map
+                    )
+                    pages.append((offset, page_df))
+                    yield ndjson_line({
+                        "type": "progress",
+                        "tracks_processed": stats.track_count,
+                        "total_tracks": total,
+                        "running_analysis": running_analysis,
+                    })
+                
+                df, stats, analysis_data = await ticket.run(assemble_pages_stage, pages, snapshot['name'], stats)
+        except AnalysisPoolFull as e:
+            yield ndjson_line({"type": "error", "status": 503, "detail": str(e), "retry_after": e.retry_after})
+            return
+        except Exception as e:
+            error = analysis_failed(e)
+            yield ndjson_line({"type": "error", "status": error.status_code, "detail": error.detail})
+            return
         
-        # Convert to DataFrame (same format as Exportify CSV)
-        df = create_dataframe_from_spotify_data(all_tracks, audio_features_map)
+        prepared = {
+            "playlist_id": playlist_id,
+            "playlist_name": snapshot['name'],
+            "snapshot_id": snapshot_id,
+            "snapshot": snapshot,
+            "df": df,
+            "stats": stats,
+            "changes": None,
+            "fetch_report": fetch_report,
+            "analysis_data": analysis_data,
+        }
+        preview = build_analysis_response(prepared, None)
+        del preview["ai_vibe_report"]
+        yield ndjson_line({"type": "analysis", **preview})
+        
+        report_parts = []
+        outcome = ReportOutcome()
+        async for delta in stream_vibe_report(analysis_data, outcome):
+            report_parts.append(delta)
+            yield ndjson_line({"type": "report_delta", "text": delta})
         
-        return playlist_data, df
+        await save_playlist_state(prepared, build_analysis_response(prepared, "".join(report_parts).strip()),
+                                  outcome.ok)
+        yield ndjson_line({"type": "done"})
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson", headers=auth_headers)
 
-def create_dataframe_from_spotify_data(tracks: list, audio_features_map: dict) -> pd.DataFrame:
-    """Convert Spotify API response to DataFrame matching Exportify format"""
-    import math
+@app.post("/analyze/csv")
+async def analyze_playlist_csv_upload(file: UploadFile = File(...), playlist_name: str = Form(None)):
+    """
+    Analyze an Exportify CSV export uploaded as multipart form data.
     
-    def safe_float(value, default=0.0):
-        """Convert value to float, handling None and NaN"""
-        if value is None:
-            return default
-        try:
-            float_val = float(value)
-            return default if math.isnan(float_val) else float_val
-        except (ValueError, TypeError):
-            return default
+    The file is parsed in chunks and each chunk is folded into running
+    statistics and a bounded sample, so memory stays flat however many
+    tracks the export has. Statistics cover every row; the AI sample is
+    drawn from the most popular tracks plus a uniform reservoir.
+    """
+    from csv_stream import fold_exportify_csv
+    name = playlist_name or os.path.splitext(file.filename or "")[0] or "Uploaded playlist"
+    logger.info("🔍 Received CSV upload for playlist: %s", name)
     
-    rows = []
+    try:
+        # Admitted before parsing: every chunk is parsed and folded in the pool
+        with get_analysis_pool().admit() as ticket:
+            stats, sample_df = await fold_exportify_csv(file.file, ticket)
+            stats, analysis_data = await ticket.run(analyze_playlist_stage, sample_df, name, stats)
+    except AnalysisPoolFull as e:
+        raise pool_full(e)
+    except ValueError as e:
+        # pandas parser errors, empty files and bad encodings are all ValueErrors
+        logger.warning("❌ Unreadable CSV upload: %s", e)
+        raise HTTPException(status_code=400, detail=f"Could not parse CSV: {e}")
+    except Exception as e:
+        raise analysis_failed(e)
+    finally:
+        await file.close()
+    analysis_data["total_tracks"] = stats.track_count
+    logger.info("✅ Folded %d tracks from CSV", stats.track_count)
     
-    for track in tracks:
-        if not track or not track.get('id'):
-            continue
-            
-        features = audio_features_map.get(track['id'], {})
+    ai_report, _ = await generate_vibe_report(analysis_data)
+    return {
+        "playlist_name": name,
+        "quantitative_analysis": analysis_data["basic_analysis"],
+        "ai_vibe_report": ai_report,
+        "analysis_metadata": {
+            "total_tracks": analysis_data["total_tracks"],
+            "tracks_analyzed": analysis_data["analyzed_tracks"],
+            "source": "exportify_csv",
+        }
+    }
+
+MAX_SIMILAR_PLAYLISTS = 50
+
+@app.get("/playlists/{playlist_id}/similar")
+async def similar_playlists(playlist_id: str, response: Response, k: int = 10,
+                            authorization: str = Header(None)):
+    """
+    The k stored playlists whose audio-feature profile (per-feature mean and
+    spread) is closest to this one's. Only previously analyzed playlists are
+    indexed; nothing is fetched or recomputed. Results are limited to public
+    playlists and the caller's own, and a playlist the caller can't see is
+    a 404 like one that was never analyzed.
+    """
+    from analysis_store import get_playlist_analysis_store
+    from spotify_auth import get_spotify_auth
+    access_token, auth_headers = await validated_access_token(authorization)
+    response.headers.update(auth_headers)
+    viewer_id = get_spotify_auth().user_id(access_token)
+    k = max(1, min(k, MAX_SIMILAR_PLAYLISTS))
+    with stage("similarity_search"):
+        similar = await asyncio.to_thread(get_playlist_analysis_store().similar, playlist_id, k, viewer_id)
+    if similar is None:
+        raise HTTPException(status_code=404, detail="Playlist has not been analyzed yet")
+    return {"playlist_id": playlist_id, "similar_playlists": similar}
+
+MAX_BATCH_PLAYLISTS = 50
+
+@app.post("/analyze/playlists")
+async def analyze_playlists_batch(data: dict, response: Response, authorization: str = Header(None)):
+    """
+    Analyze many playlists at once: {"playlist_ids": [...]} or {"all": true}
+    for every playlist in the user's library. An explicit list longer than
+    MAX_BATCH_PLAYLISTS is a 400; for a larger library the first
+    MAX_BATCH_PLAYLISTS are analyzed and the rest are listed as skipped.
+    
+    Playlists are fetched concurrently and track IDs are deduplicated across
+    them before audio features are requested, so shared tracks cost one
+    lookup. Returns per-playlist quantitative analyses (no AI reports) and
+    a combined library profile over the unique tracks.
+    """
+    access_token, auth_headers = await validated_access_token(authorization)
+    response.headers.update(auth_headers)
+    from spotify_client import FetchReport, get_spotify_client
+    from stats_engine import PlaylistStats
+    client = get_spotify_client()
+    
+    try:
+        if data.get("all"):
+            playlist_ids = await client.get_my_playlist_ids(access_token)
+        else:
+            playlist_ids = list(dict.fromkeys(data.get("playlist_ids") or []))
+        if not playlist_ids:
+            raise HTTPException(status_code=400, detail="No playlists to analyze")
+        if len(playlist_ids) > MAX_BATCH_PLAYLISTS and not data.get("all"):
+            raise HTTPException(status_code=400,
+                                detail=f"At most {MAX_BATCH_PLAYLISTS} playlists per batch, got {len(playlist_ids)}")
+        playlists_requested = len(playlist_ids)
+        playlist_ids, skipped_ids = playlist_ids[:MAX_BATCH_PLAYLISTS], playlist_ids[MAX_BATCH_PLAYLISTS:]
+        logger.info("🔍 Batch analysis for %d playlists", len(playlist_ids))
+        
+        # 1. Metadata and track listings for every playlist, concurrently
+        async def fetch_playlist(playlist_id: str):
+            return await asyncio.gather(
+                client.get_playlist_snapshot(access_token, playlist_id),
+                client.get_playlist_tracks(access_token, playlist_id),
+            )
+        fetched = await asyncio.gather(*(fetch_playlist(pid) for pid in playlist_ids), return_exceptions=True)
         
-        # Safely extract artist names
-        artist_names = []
-        for artist in track.get('artists', []):
-            if isinstance(artist, dict) and 'name' in artist:
-                artist_names.append(artist['name'])
+        # 2. Audio features once per unique track across all playlists
+        unique_tracks = {}
+        track_entries = 0
+        for result in fetched:
+            if isinstance(result, BaseException):
+                continue
+            for track in result[1]:
+                if track.get('id'):
+                    unique_tracks.setdefault(track['id'], track)
+                    track_entries += 1
+        fetch_report = FetchReport()
+        audio_features_map = await client.get_audio_features(access_token, list(unique_tracks), fetch_report)
+        logger.info("✅ %d track entries, %d unique tracks", track_entries, len(unique_tracks))
         
-        # Debug audio features for first few tracks
-        if len(rows) < 3:
-            print(f"🔍 Track {len(rows) + 1}: {track.get('name', 'Unknown')}")
-            print(f"🔍 Raw features: {features}")
-            print(f"🔍 Danceability raw: {features.get('danceability')}, safe_float: {safe_float(features.get('danceability'))}")
-            print(f"🔍 Energy raw: {features.get('energy')}, safe_float: {safe_float(features.get('energy'))}")
+        # 3. Per-playlist analyses, then the combined library profile; the
+        #    whole batch is admitted to the analysis pool once
+        playlists = []
+        with get_analysis_pool().admit() as ticket:
+            for playlist_id, result in zip(playlist_ids, fetched):
+                if isinstance(result, BaseException):
+                    logger.warning("❌ Failed to fetch playlist %s: %s", playlist_id, result)
+                    playlists.append({"playlist_id": playlist_id, "error": str(result)})
+                    continue
+                snapshot, tracks = result
+                df = await ticket.run(create_dataframe_from_spotify_data, tracks, audio_features_map)
+                _, analysis_data = await ticket.run(analyze_playlist_stage, df, snapshot['name'], None)
+                if fetch_report.as_dict()["complete"]:
+                    await save_playlist_analysis(playlist_id, snapshot, analysis_data["basic_analysis"])
+                playlists.append({
+                    "playlist_id": playlist_id,
+                    "playlist_name": snapshot['name'],
+                    "quantitative_analysis": analysis_data["basic_analysis"],
+                    "analysis_metadata": {
+                        "total_tracks": analysis_data["total_tracks"],
+                        "snapshot_id": snapshot.get('snapshot_id'),
+                    }
+                })
+            
+            library_df = await ticket.run(create_dataframe_from_spotify_data, list(unique_tracks.values()),
+                                          audio_features_map)
+            library_stats = await ticket.run(PlaylistStats.from_dataframe, library_df)
         
-        row = {
-            "Track Name": track.get('name', ''),
-            "Artist Name(s)": ", ".join(artist_names),
-            "Album Name": track.get('album', {}).get('name', '') if isinstance(track.get('album'), dict) else '',
-            "Track ID": track.get('id', ''),
-            "Popularity": safe_float(track.get('popularity'), 0),
-            "Duration (ms)": safe_float(track.get('duration_ms'), 0),
-            "Explicit": bool(track.get('explicit', False)),
-            # Audio features - ensure all are valid floats
-            "Danceability": safe_float(features.get('danceability')),
-            "Energy": safe_float(features.get('energy')),
-            "Valence": safe_float(features.get('valence')),
-            "Acousticness": safe_float(features.get('acousticness')),
-            "Instrumentalness": safe_float(features.get('instrumentalness')),
-            "Liveness": safe_float(features.get('liveness')),
-            "Speechiness": safe_float(features.get('speechiness')),
-            "Tempo": safe_float(features.get('tempo')),
+        return {
+            "playlists": playlists,
+            "library_profile": library_stats.finalize(),
+            "batch_metadata": {
+                "playlists_requested": playlists_requested,
+                "playlists_skipped": skipped_ids,
+                "playlists_analyzed": sum(1 for p in playlists if "error" not in p),
+                "track_entries": track_entries,
+                "unique_tracks": len(unique_tracks),
+                "spotify_fetch": fetch_report.as_dict(),
+            }
         }
-        rows.append(row)
     
-    if not rows:
-        # Return empty DataFrame with expected columns if no tracks
-        return pd.DataFrame(columns=[
-            "Track Name", "Artist Name(s)", "Album Name", "Track ID", "Popularity",
-            "Duration (ms)", "Explicit", "Danceability", "Energy", "Valence",
-            "Acousticness", "Instrumentalness", "Liveness", "Speechiness", "Tempo"
-        ])
+    except HTTPException:
+        raise
+    except AnalysisPoolFull as e:
+        raise pool_full(e)
+    except Exception as e:
+        raise analysis_failed(e)
+
+def ndjson_line(payload: Dict) -> str:
+    return json.dumps(payload) + "\n"
+
+async def get_playlist_from_spotify(access_token: str, playlist_id: str, fetch_report: FetchReport = None,
+                                    playlist_data: Dict = None):
+    """
+    Get playlist metadata, tracks and audio features from Spotify API;
+    metadata the caller already has is passed in as `playlist_data`
+    """
+    from spotify_client import get_spotify_client
+    client = get_spotify_client()
+    
+    # Track pages and audio-feature batches are fetched concurrently
+    # over the shared connection pool
+    with stage("spotify_fetch"):
+        playlist_data, all_tracks, audio_features_map = await client.get_playlist_with_features(
+            access_token, playlist_id, fetch_report, playlist_data
+        )
+    logger.debug("🔍 Got %d audio features for %d tracks", len(audio_features_map), len(all_tracks))
     
-    return pd.DataFrame(rows)
+    return playlist_data, all_tracks, audio_features_map
 
-def analyze_playlist_from_dataframe(df: pd.DataFrame, playlist_name: str):
-    """Adapter to use your existing analysis engine with DataFrame"""
-    print(f"🔍 Input DataFrame shape: {df.shape}")
-    print(f"🔍 Input DataFrame columns: {list(df.columns)}")
-    print(f"🔍 Sample audio features before CSV conversion:")
-    if 'Danceability' in df.columns:
-        print(f"  Danceability: {df['Danceability'].head(3).tolist()}")
-    if 'Energy' in df.columns:
-        print(f"  Energy: {df['Energy'].head(3).tolist()}")
+async def fetch_playlist_changes(access_token: str, playlist_id: str, state: PlaylistState,
+                                 fetch_report: FetchReport = None):
+    """
+    Diff a stored playlist state against the playlist's current track IDs.
+
+    Only the ID listing is refetched; full track objects and audio features
+    are requested for added tracks alone. Returns (added tracks, their
+    audio features, removed ID multiset) for apply_playlist_changes.
+    """
+    from spotify_client import get_spotify_client
+    client = get_spotify_client()
+    with stage("spotify_fetch"):
+        track_ids = await client.get_playlist_track_ids(access_token, playlist_id)
+        added, removed = diff_track_ids(state.tracks["Track ID"].tolist(), track_ids)
+        
+        added_unique = list(added)
+        added_tracks, audio_features_map = await asyncio.gather(
+            client.get_tracks(access_token, added_unique),
+            client.get_audio_features(access_token, added_unique, fetch_report),
+        )
+    tracks_by_id = {track['id']: track for track in added_tracks}
+    added_tracks = [tracks_by_id[track_id] for track_id in added.elements() if track_id in tracks_by_id]
+    return added_tracks, audio_features_map, removed
+
+def apply_playlist_changes(state: PlaylistState, added_tracks: list, audio_features_map: dict, removed: Counter):
+    """
+    CPU-bound half of an incremental update; runs in the analysis pool.
+
+    The stored aggregates are updated by subtracting removed rows and
+    merging added ones, and the track table is rebuilt from what's kept.
+    """
+    from stats_engine import PlaylistStats
+    added_df = create_dataframe_from_spotify_data(added_tracks, audio_features_map)
+    
+    removed_mask = select_removed_rows(state.tracks, removed)
+    stats = state.stats
+    with stage("statistics"):
+        stats.subtract(PlaylistStats.from_dataframe(state.tracks[removed_mask]))
+        stats.merge(PlaylistStats.from_dataframe(added_df))
     
-    # Convert DataFrame to CSV string to reuse your existing code
-    csv_content = df.to_csv(index=False)
+    kept = state.tracks[~removed_mask]
+    df = concat_track_frames([kept, added_df]) if len(added_df) else kept.reset_index(drop=True)
     
-    print(f"🔍 CSV content length: {len(csv_content)}")
-    print(f"🔍 CSV sample (first 500 chars): {csv_content[:500]}")
+    changes = {"added": len(added_df), "removed": int(removed_mask.sum())}
+    logger.info("✅ Incremental update: +%d / -%d tracks", changes['added'], changes['removed'])
+    return df, stats, changes
+
+def concat_track_frames(frames: list) -> pd.DataFrame:
+    """Track DataFrames stacked in order, with the name/artist columns categorical again"""
+    import pandas as pd
+    df = pd.concat(frames, ignore_index=True)
+    # Categoricals with different categories concat to object columns
+    for column in ("Artist Name(s)", "Album Name", ARTISTS_COLUMN):
+        df[column] = df[column].astype("category")
+    return df
+
+def create_dataframe_from_spotify_data(tracks: list, audio_features_map: dict) -> pd.DataFrame:
+    """Convert Spotify API response to DataFrame matching Exportify format"""
+    from track_table import TrackTable
+    # Typed columnar arrays filled in one pass; the DataFrame is a zero-copy view
+    with stage("dataframe_build"):
+        return TrackTable.from_spotify(tracks, audio_features_map).to_dataframe()
+
+def analyze_playlist_from_dataframe(df: pd.DataFrame, playlist_name: str, stats: PlaylistStats = None):
+    """Adapter to use your existing analysis engine with DataFrame"""
+    # Payload dumps only when LOG_LEVEL=DEBUG; skip building them otherwise
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"🔍 Input DataFrame shape: {df.shape}")
+        logger.debug(f"🔍 Input DataFrame columns: {list(df.columns)}")
+        if 'Danceability' in df.columns:
+            logger.debug(f"  Danceability: {df['Danceability'].head(3).tolist()}")
+        if 'Energy' in df.columns:
+            logger.debug(f"  Energy: {df['Energy'].head(3).tolist()}")
     
-    return analyze_playlist_data(csv_content, playlist_name)
\ No newline at end of file
+    # The engine works on the typed DataFrame directly, no CSV round trip
+    from analysis_engine import analyze_playlist_data
+    return analyze_playlist_data(df, playlist_name, stats)
@@ -0,0 +1,174 @@
+# metrics.py
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Latency buckets in seconds, from sub-millisecond stats up to slow LLM calls
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# Set while a job runs in an analysis-pool worker process: observations are
+# collected here and sent back with the result instead of staying in the worker
+_captured: Optional[List[Tuple[str, float, LabelKey]]] = None
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """Monotonic counter, optionally labelled. Thread-safe (the analysis pool records from threads)."""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str):
+        self._record(amount, _label_key(labels))
+
+    def _record(self, amount: float, key: LabelKey):
+        if _captured is not None:
+            _captured.append((self.name, amount, key))
+            return
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus exposition format"""
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series: Dict[LabelKey, List[float]] = {}  # bucket counts..., sum, count
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        self._record(value, _label_key(labels))
+
+    def _record(self, value: float, key: LabelKey):
+        if _captured is not None:
+            _captured.append((self.name, value, key))
+            return
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def totals(self) -> Dict[LabelKey, Tuple[int, float]]:
+        """(count, sum) per label set"""
+        with self._lock:
+            return {key: (int(series[-1]), series[-2]) for key, series in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in self._series.items():
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', repr(bound)))} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "vibe_stage_duration_seconds",
+    "Time spent per pipeline stage (spotify_fetch, dataframe_build, statistics, sampling, prompt_build, llm_call)",
+)
+REQUEST_SECONDS = Histogram("vibe_http_request_duration_seconds", "HTTP request latency by route")
+PROMPT_TOKENS = Histogram("vibe_prompt_tokens", "Estimated tokens per vibe-report prompt",
+                          buckets=(100, 200, 300, 400, 600, 800, 1200, 1600, 2400, 3200))
+TRACKS_PROCESSED = Counter("vibe_tracks_processed_total", "Tracks run through the analysis stage")
+STAGE_ERRORS = Counter("vibe_stage_errors_total", "Pipeline stages that raised")
+
+_metrics: List[Any] = [STAGE_SECONDS, REQUEST_SECONDS, PROMPT_TOKENS, TRACKS_PROCESSED, STAGE_ERRORS]
+_collectors: List[Tuple[str, Callable[[], Dict[str, Any]]]] = []
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a pipeline stage into vibe_stage_duration_seconds{stage=name}"""
+    started_at = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        # Cancellations and client disconnects aren't stage failures
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started_at, stage=name)
+
+
+def call_capturing(fn: Callable[..., Any], *args: Any) -> Tuple[Any, Optional[BaseException], list]:
+    """
+    Run `fn(*args)` in a worker process, returning (result, exception, the
+    metric observations it made) so the parent can replay them with
+    `replay_captured` and /metrics still shows the work done in workers.
+    """
+    global _captured
+    _captured = []
+    try:
+        return fn(*args), None, _captured
+    except Exception as e:
+        return None, e, _captured
+    finally:
+        _captured = None
+
+
+def replay_captured(observations: list):
+    by_name = {metric.name: metric for metric in _metrics}
+    for name, value, key in observations:
+        by_name[name]._record(value, key)
+
+
+def register_collector(prefix: str, collect: Callable[[], Dict[str, Any]]):
+    """
+    Export an existing `stats()` dict as gauges named vibe_<prefix>_<key> at
+    scrape time (numeric values only), so components keep their own counters.
+    """
+    _collectors.append((prefix, collect))
+
+
+def render_metrics() -> str:
+    """Everything in the Prometheus text exposition format"""
+    lines: List[str] = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for prefix, collect in _collectors:
+        try:
+            values = collect()
+        except Exception:
+            continue
+        for key, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"vibe_{prefix}_{key}"
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
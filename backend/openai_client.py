@@ -0,0 +1,37 @@
+# openai_client.py
+import os
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import openai
+
+# Model parameters for the vibe report
+REPORT_MODEL = os.getenv("OPENAI_MODEL", "gpt-4")  # or "gpt-3.5-turbo" for testing
+REPORT_MAX_TOKENS = 800
+REPORT_TEMPERATURE = 0.8
+
+_client: Optional["openai.AsyncOpenAI"] = None
+
+
+def get_openai_client() -> Optional["openai.AsyncOpenAI"]:
+    """
+    Shared async OpenAI client, built once and reused so completions never
+    block the event loop and reuse the same connection pool.
+    Returns None when no API key is configured. The SDK is imported on
+    first use, so cold starts that never reach the report don't pay for it.
+    """
+    global _client
+    if _client is None:
+        api_key = os.getenv('OPENAI_API_KEY')
+        if not api_key:
+            return None
+        import openai
+        _client = openai.AsyncOpenAI(api_key=api_key)
+    return _client
+
+
+async def close_openai_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
@@ -0,0 +1,76 @@
+# playlist_index.py
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Smallest per-dimension spread used for z-scoring; Spotify features are
+# reported to three or so decimals, so anything below this is noise
+MIN_SCALE = 1e-6
+
+
+class BruteForceIndex:
+    """
+    Exact k-nearest-neighbour search over a dense (n, d) matrix.
+
+    Dimensions are z-scored over the indexed playlists before measuring
+    Euclidean distance, so tempo (in BPM) doesn't drown out features on a
+    0-1 scale. The scaled matrix and its row norms are cached until the
+    next upsert, so a search is one matrix-vector product plus a partial
+    sort. A partitioned index (IVF over k-means cells) can replace this
+    class behind the same upsert/search interface once a full scan gets slow.
+    """
+
+    def __init__(self, dimensions: int, capacity: int = 1024):
+        self._vectors = np.zeros((capacity, dimensions), dtype=np.float64)
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._scaled: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def upsert(self, key: str, vector: Sequence[float]):
+        row = self._rows.get(key)
+        if row is None:
+            row = len(self._ids)
+            if row == len(self._vectors):
+                self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+            self._ids.append(key)
+            self._rows[key] = row
+        self._vectors[row] = vector
+        self._scaled = None
+
+    def vector(self, key: str) -> Optional[np.ndarray]:
+        row = self._rows.get(key)
+        return None if row is None else self._vectors[row].copy()
+
+    def _scaled_matrix(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """(per-dimension mean, 1 / per-dimension std, z-scored vectors, their squared norms)"""
+        if self._scaled is None:
+            vectors = self._vectors[:len(self._ids)]
+            mean = vectors.mean(axis=0)
+            # Centering keeps the norms small enough for the expanded distance
+            # below; the floor keeps dimensions that only differ by rounding
+            # noise from being blown up into the dominant ones
+            scale = np.maximum(vectors.std(axis=0), MIN_SCALE)
+            scaled = (vectors - mean) / scale
+            self._scaled = (mean, 1.0 / scale, scaled, np.einsum("ij,ij->i", scaled, scaled))
+        return self._scaled
+
+    def search(self, query: np.ndarray, k: int, exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """Up to `k` (key, distance) pairs nearest to `query`, closest first"""
+        n = len(self._ids)
+        if n == 0 or k <= 0:
+            return []
+        mean, inverse_scale, scaled, norms = self._scaled_matrix()
+        query = (query - mean) * inverse_scale
+        # |x - q|^2 = |x|^2 - 2 x.q + |q|^2; clipped since rounding can dip below 0
+        squared = norms - 2.0 * (scaled @ query) + query @ query
+        np.maximum(squared, 0.0, out=squared)
+        if exclude is not None and exclude in self._rows:
+            squared[self._rows[exclude]] = np.inf
+
+        k = min(k, n)
+        nearest = np.argpartition(squared, k - 1)[:k]
+        nearest = nearest[np.argsort(squared[nearest], kind="stable")]
+        return [(self._ids[i], float(np.sqrt(squared[i]))) for i in nearest if np.isfinite(squared[i])]
@@ -0,0 +1,134 @@
+# report_cache.py
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+def report_cache_key(messages: List[Dict[str, str]], **model_params: Any) -> str:
+    """Content address of a completion: rendered messages plus model parameters"""
+    payload = json.dumps({"messages": messages, "params": model_params}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ReportCache:
+    """
+    TTL + size-bounded LRU cache of vibe reports with single-flight dedup.
+
+    Concurrent requests for the same key share one in-flight completion:
+    the first caller owns it, everyone else awaits its future. Failures
+    are propagated to all waiters and never cached.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        if max_entries is None:
+            max_entries = int(os.getenv("REPORT_CACHE_SIZE", "1024"))
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv("REPORT_CACHE_TTL_SECONDS", "21600"))
+        self.max_entries = max(0, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, report = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return report
+
+    def put(self, key: str, report: str):
+        if self.max_entries == 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, report)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def claim(self, key: str) -> Tuple[asyncio.Future, bool]:
+        """
+        Join or start the in-flight computation for `key`.
+
+        Returns (future, owner). The owner must finish with `resolve()` or
+        `fail()`; other callers just await the future.
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return future, False
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self.misses += 1
+        return future, True
+
+    def resolve(self, key: str, report: str):
+        self.put(key, report)
+        future = self._inflight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(report)
+
+    def fail(self, key: str, error: BaseException):
+        future = self._inflight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_exception(error)
+            # Mark retrieved so a failure nobody waited on isn't logged as unhandled
+            future.exception()
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        """Cached report, the shared in-flight one, or a fresh `compute()`"""
+        report = self.get(key)
+        if report is not None:
+            return report
+
+        future, owner = self.claim(key)
+        if not owner:
+            return await asyncio.shield(future)
+
+        # Run the completion as its own task so a disconnecting owner
+        # doesn't cancel it for the requests coalesced onto it
+        task = asyncio.ensure_future(compute())
+
+        def finish(done: asyncio.Future):
+            if done.cancelled():
+                self.fail(key, RuntimeError("Report completion was cancelled"))
+            elif done.exception() is not None:
+                self.fail(key, done.exception())
+            else:
+                self.resolve(key, done.result())
+
+        task.add_done_callback(finish)
+        return await asyncio.shield(future)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+
+_cache: Optional[ReportCache] = None
+
+
+def get_report_cache() -> ReportCache:
+    global _cache
+    if _cache is None:
+        _cache = ReportCache()
+    return _cache
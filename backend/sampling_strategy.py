@@ -1,77 +1,97 @@
 # sampling_strategy.py
+import numpy as np
 import pandas as pd
-import random
 
-def create_strategic_sample(df: pd.DataFrame, max_tracks: int = 100) -> pd.DataFrame:
+DIVERSITY_FEATURES = ['Danceability', 'Energy', 'Valence', 'Acousticness',
+                      'Instrumentalness', 'Liveness', 'Speechiness', 'Tempo']
+
+def create_strategic_sample(df: pd.DataFrame, max_tracks: int = 100, seed: int = 42) -> pd.DataFrame:
     """
     Create a smart sample that represents the playlist's diversity
     without external dependencies
+
+    Works on positions into the audio-feature matrix, so dedup between
+    strategies is a boolean mask instead of DataFrame anti-joins. Uses a
+    local RNG, so results are reproducible without touching global state.
     """
     if len(df) <= max_tracks:
         return df
-    
-    # Set random seed for reproducibility
-    random.seed(42)
-    
+
+    rng = np.random.default_rng(seed)
+    taken = np.zeros(len(df), dtype=bool)
+    picks = []
+
     # Strategy 1: Most popular tracks (40%)
     popular_count = int(max_tracks * 0.4)
     if 'Popularity' in df.columns:
-        popular_samples = df.nlargest(popular_count * 2, 'Popularity')  # Get extra to account for duplicates
+        popularity = pd.to_numeric(df['Popularity'], errors='coerce').fillna(0).to_numpy()
+        popular = np.argpartition(-popularity, popular_count)[:popular_count]
+        popular = popular[np.argsort(-popularity[popular], kind='stable')]
     else:
-        popular_samples = df.head(popular_count * 2)
-    
+        popular = np.arange(popular_count)
+    taken[popular] = True
+    picks.append(popular)
+
     # Strategy 2: Diverse audio features (40%)
     diverse_count = int(max_tracks * 0.4)
-    diverse_samples = get_diverse_tracks_simple(df, diverse_count * 2)
-    
-    # Strategy 3: Random sample (20%)
-    random_count = max_tracks - (popular_count + diverse_count)
-    random_samples = df.sample(min(random_count * 2, len(df)), random_state=42)
-    
-    # Combine all strategies
-    combined = pd.concat([popular_samples, diverse_samples, random_samples])
-    
-    # Remove duplicates and trim to max_tracks
-    result = combined.drop_duplicates().head(max_tracks)
-    
-    # If we don't have enough tracks, fill with random
-    if len(result) < max_tracks:
-        additional_needed = max_tracks - len(result)
-        additional_tracks = df[~df.index.isin(result.index)].sample(additional_needed, random_state=42)
-        result = pd.concat([result, additional_tracks])
-    
-    return result
-
-def get_diverse_tracks_simple(df: pd.DataFrame, n: int) -> pd.DataFrame:
-    """Simple diversity sampling without scipy"""
+    diverse = get_diverse_tracks(df, diverse_count, rng, exclude=taken)
+    taken[diverse] = True
+    picks.append(diverse)
+
+    # Strategy 3: Random sample (rest), and fill if anything came up short
+    random_count = max_tracks - sum(len(p) for p in picks)
+    remaining = np.flatnonzero(~taken)
+    picks.append(rng.choice(remaining, size=min(random_count, len(remaining)), replace=False))
+
+    return df.iloc[np.concatenate(picks)]
+
+def get_diverse_tracks(df: pd.DataFrame, n: int, rng: np.random.Generator,
+                       exclude: np.ndarray = None) -> np.ndarray:
+    """
+    Positions of `n` tracks spread across audio-feature space.
+
+    Greedy farthest-point sampling on standardized features: each pick is
+    the track farthest from everything chosen so far (including `exclude`d
+    tracks), which covers the playlist's spread rather than just its
+    extremes. O(n_tracks * n) with one vectorized distance update per pick.
+    """
+    candidates = np.ones(len(df), dtype=bool) if exclude is None else ~exclude
+    n = min(n, int(candidates.sum()))
     if n <= 0:
-        return pd.DataFrame()
-    
-    features = ['Danceability', 'Energy', 'Valence', 'Acousticness']
-    available_features = [f for f in features if f in df.columns]
-    
+        return np.empty(0, dtype=np.int64)
+
+    available_features = [f for f in DIVERSITY_FEATURES if f in df.columns]
     if not available_features:
-        return df.sample(min(n, len(df)), random_state=42)
-    
-    # Get tracks with extreme values for each feature
-    diverse_indices = set()
-    
-    for feature in available_features:
-        # Highest values
-        high_indices = df[feature].nlargest(3).index
-        diverse_indices.update(high_indices)
-        
-        # Lowest values
-        low_indices = df[feature].nsmallest(3).index
-        diverse_indices.update(low_indices)
-    
-    # Convert to DataFrame
-    diverse_tracks = df.loc[list(diverse_indices)]
-    
-    # If we need more tracks, add random ones
-    if len(diverse_tracks) < n:
-        additional_needed = n - len(diverse_tracks)
-        additional_tracks = df[~df.index.isin(diverse_tracks.index)].sample(additional_needed, random_state=42)
-        diverse_tracks = pd.concat([diverse_tracks, additional_tracks])
-    
-    return diverse_tracks.head(n)
\ No newline at end of file
+        return rng.choice(np.flatnonzero(candidates), size=n, replace=False)
+
+    points = df[available_features].to_numpy(dtype=np.float64, na_value=np.nan)
+    points = np.nan_to_num(points - np.nanmean(points, axis=0))
+    scale = points.std(axis=0)
+    points /= np.where(scale > 0, scale, 1.0)
+
+    # |x - p|^2 = |x|^2 - 2 x.p + |p|^2: one mat-vec per pick
+    norms = np.einsum('ij,ij->i', points, points)
+
+    def squared_distances(i):
+        return norms - 2.0 * (points @ points[i]) + norms[i]
+
+    # Distance from every track to its nearest chosen (or excluded) track
+    nearest = np.full(len(points), np.inf)
+    anchors = np.flatnonzero(~candidates)
+    chosen = []
+    if len(anchors) == 0:
+        # Nothing to spread away from yet: seed from a random track
+        chosen.append(int(rng.integers(len(points))))
+        anchors = chosen
+    for anchor in anchors:
+        nearest = np.minimum(nearest, squared_distances(anchor))
+    nearest[~candidates] = -np.inf
+    nearest[chosen] = -np.inf
+
+    while len(chosen) < n:
+        pick = int(np.argmax(nearest))
+        chosen.append(pick)
+        nearest = np.minimum(nearest, squared_distances(pick))
+        nearest[pick] = -np.inf
+
+    return np.asarray(chosen, dtype=np.int64)
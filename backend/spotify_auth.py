@@ -0,0 +1,274 @@
+# spotify_auth.py
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from spotify_client import SPOTIFY_API_BASE
+
+SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
+
+logger = logging.getLogger(__name__)
+
+
+class SpotifyAuthError(Exception):
+    """A token or authorization code Spotify won't accept; `status_code` is what the client should see"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class TokenInfo:
+    """What we know about one access token"""
+    user_id: str
+    # Unix time the token lapses, when we issued it; None for tokens we only validated
+    expires_at: Optional[float]
+    checked_at: float
+
+
+@dataclass
+class UserSession:
+    """A user's current token pair, as issued by the last exchange or refresh"""
+    user_id: str
+    access_token: str
+    refresh_token: str
+    expires_at: float
+
+
+class SpotifyAuth:
+    """
+    Async authorization-code and refresh-token flows on a pooled client,
+    plus a server-side cache of tokens and per-user sessions.
+
+    Tokens issued through this service have a known expiry; when one is
+    presented within `refresh_margin` of it, the user's session is refreshed
+    first (single-flight per user) and the new token is used instead.
+    Tokens issued elsewhere, or before a restart, are checked with one /me
+    call and trusted for `validation_ttl`, so an expired token fails fast
+    instead of partway through a multi-page fetch.
+
+    Token and /me calls go through this class's own small connection pool,
+    not the analysis SpotifyClient, so logins never wait behind its rate
+    limiter or concurrency slots.
+    """
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None,
+                 token_url: str = SPOTIFY_TOKEN_URL, api_base: str = SPOTIFY_API_BASE,
+                 max_entries: Optional[int] = None):
+        if max_entries is None:
+            max_entries = int(os.getenv("SPOTIFY_AUTH_CACHE_SIZE", "10000"))
+        self.token_url = token_url
+        self.api_base = api_base
+        self.max_entries = max(1, max_entries)
+        self.client_id = os.getenv("SPOTIFY_CLIENT_ID")
+        self.client_secret = os.getenv("SPOTIFY_CLIENT_SECRET")
+        self.redirect_uri = os.getenv("SPOTIFY_REDIRECT_URI", "http://127.0.0.1:3000/api/auth/callback")
+        self.refresh_margin = float(os.getenv("SPOTIFY_TOKEN_REFRESH_MARGIN", "300"))
+        self.validation_ttl = float(os.getenv("SPOTIFY_TOKEN_VALIDATION_TTL", "300"))
+
+        self._tokens: "OrderedDict[str, TokenInfo]" = OrderedDict()
+        self._sessions: "OrderedDict[str, UserSession]" = OrderedDict()
+        self._refreshing: Dict[str, asyncio.Task] = {}
+
+        self.exchanges = 0
+        self.refreshes = 0
+        self.validations = 0
+        self.rejected = 0
+        # Logins get their own small pool, so they never queue behind analysis traffic
+        self._http = httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+        )
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    def _remember(self, cache: OrderedDict, key: str, value: Any):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.max_entries:
+            cache.popitem(last=False)
+
+    async def _token_request(self, form: Dict[str, str]) -> Dict[str, Any]:
+        """POST to the accounts token endpoint; Spotify's 4xx verdicts become SpotifyAuthError"""
+        try:
+            response = await self._http.post(
+                self.token_url, data=form, auth=(self.client_id or "", self.client_secret or "")
+            )
+        except httpx.TransportError as e:
+            # Not retried: an authorization code is single-use
+            raise SpotifyAuthError(502, f"Spotify accounts service unreachable: {type(e).__name__}")
+        if response.status_code >= 400:
+            try:
+                error = response.json()
+            except ValueError:
+                error = {}
+            status = response.status_code if response.status_code < 500 else 502
+            raise SpotifyAuthError(status, error.get("error_description") or error.get("error")
+                                   or f"Spotify token endpoint returned {response.status_code}")
+        return response.json()
+
+    async def _get_current_user(self, access_token: str) -> Dict[str, Any]:
+        """The token owner's profile; also the cheapest check that Spotify still accepts the token"""
+        response = await self._http.get(f"{self.api_base}/me", headers={"Authorization": f"Bearer {access_token}"})
+        response.raise_for_status()
+        return response.json()
+
+    async def _lookup_user(self, access_token: str) -> Optional[str]:
+        """Spotify user ID owning a token we just issued, or None if /me isn't answering"""
+        try:
+            return (await self._get_current_user(access_token))["id"]
+        except httpx.HTTPError as e:
+            # The token is fine; it just gets validated on first use instead
+            logger.warning("❌ Couldn't look up the user for a new token: %s", e)
+            return None
+
+    def _start_session(self, token_data: Dict[str, Any], user_id: str,
+                       refresh_token: Optional[str] = None) -> UserSession:
+        """Cache a freshly issued token pair under its user"""
+        now = time.time()
+        access_token = token_data["access_token"]
+        # A refresh response may omit the refresh token, meaning the old one stays valid
+        session = UserSession(user_id, access_token, token_data.get("refresh_token") or refresh_token,
+                              now + float(token_data.get("expires_in", 3600)))
+        self._remember(self._sessions, user_id, session)
+        self._remember(self._tokens, access_token, TokenInfo(user_id, session.expires_at, now))
+        return session
+
+    async def exchange_code(self, code: str) -> Dict[str, Any]:
+        """Authorization code -> Spotify's token response, with the session cached server-side"""
+        token_data = await self._token_request({
+            "grant_type": "authorization_code",
+            "code": code,
+            "redirect_uri": self.redirect_uri,
+        })
+        self.exchanges += 1
+        user_id = await self._lookup_user(token_data["access_token"])
+        if user_id is not None:
+            self._start_session(token_data, user_id)
+        return token_data
+
+    async def refresh(self, refresh_token: str) -> Dict[str, Any]:
+        """Refresh token -> token response, updating the user's cached session"""
+        session = next((session for session in self._sessions.values()
+                        if session.refresh_token == refresh_token), None)
+        if session is None:
+            token_data = await self._token_request({"grant_type": "refresh_token", "refresh_token": refresh_token})
+            self.refreshes += 1
+            user_id = await self._lookup_user(token_data["access_token"])
+            if user_id is None:
+                return {**token_data, "refresh_token": token_data.get("refresh_token") or refresh_token}
+            session = self._start_session(token_data, user_id, refresh_token)
+        else:
+            session = await self._refresh_session(session)
+        return {
+            "access_token": session.access_token,
+            "token_type": "Bearer",
+            "expires_in": max(0, int(session.expires_at - time.time())),
+            "refresh_token": session.refresh_token,
+        }
+
+    async def _refresh_session(self, session: UserSession) -> UserSession:
+        """Refresh a user's session once, however many requests need it at the same time"""
+        task = self._refreshing.get(session.user_id)
+        if task is None:
+            task = asyncio.ensure_future(self._do_refresh(session))
+            self._refreshing[session.user_id] = task
+            task.add_done_callback(lambda _: self._refreshing.pop(session.user_id, None))
+        # Shielded: one caller giving up shouldn't cancel the refresh for the rest
+        return await asyncio.shield(task)
+
+    async def _do_refresh(self, session: UserSession) -> UserSession:
+        token_data = await self._token_request({
+            "grant_type": "refresh_token",
+            "refresh_token": session.refresh_token,
+        })
+        self.refreshes += 1
+        logger.info("🔑 Refreshed Spotify token for user %s", session.user_id)
+        return self._start_session(token_data, session.user_id, session.refresh_token)
+
+    async def ensure_valid(self, access_token: str) -> Tuple[str, Optional[UserSession]]:
+        """
+        (token to use for this request, the refreshed session if it was
+        swapped for a new one). The session carries the refresh token to hand
+        back, since Spotify may rotate it. Raises SpotifyAuthError(401) when
+        the token is expired or revoked.
+        """
+        now = time.time()
+        info = self._tokens.get(access_token)
+
+        if info is not None and info.expires_at is not None:
+            if info.expires_at <= now:
+                # Never traded for the session's tokens: an expired token is worth nothing
+                self.rejected += 1
+                raise SpotifyAuthError(401, "Spotify access token expired")
+            if info.expires_at - now > self.refresh_margin:
+                return access_token, None
+            session = self._sessions.get(info.user_id)
+            if session is not None and session.expires_at - now > self.refresh_margin:
+                # Someone already refreshed this user's session
+                return session.access_token, session if session.access_token != access_token else None
+            if session is not None:
+                try:
+                    session = await self._refresh_session(session)
+                    return session.access_token, session
+                except SpotifyAuthError as e:
+                    logger.warning("❌ Token refresh failed for user %s: %s", info.user_id, e.detail)
+            return access_token, None
+
+        if info is not None and now - info.checked_at < self.validation_ttl:
+            return access_token, None
+
+        # Unknown to us: one cheap call instead of failing mid-fetch
+        self.validations += 1
+        try:
+            profile = await self._get_current_user(access_token)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 401:
+                self._tokens.pop(access_token, None)
+                self.rejected += 1
+                raise SpotifyAuthError(401, "Spotify access token expired or revoked")
+            raise
+        self._remember(self._tokens, access_token, TokenInfo(profile["id"], None, now))
+        return access_token, None
+
+    def user_id(self, access_token: str) -> Optional[str]:
+        """Spotify user ID of a token ensure_valid has accepted, if it's still cached"""
+        info = self._tokens.get(access_token)
+        return info.user_id if info is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cached_tokens": len(self._tokens),
+            "sessions": len(self._sessions),
+            "exchanges": self.exchanges,
+            "refreshes": self.refreshes,
+            "validations": self.validations,
+            "rejected": self.rejected,
+        }
+
+
+_auth: Optional[SpotifyAuth] = None
+
+
+def get_spotify_auth() -> SpotifyAuth:
+    global _auth
+    if _auth is None:
+        _auth = SpotifyAuth()
+    return _auth
+
+
+async def close_spotify_auth():
+    global _auth
+    if _auth is not None:
+        await _auth.aclose()
+        _auth = None
@@ -0,0 +1,581 @@
+# spotify_client.py
+import asyncio
+import email.utils
+import hashlib
+import logging
+import os
+import random
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+import httpx
+
+from features_cache import AudioFeaturesCache, get_audio_features_cache
+
+try:
+    import h2  # noqa: F401  (only needed so httpx can negotiate HTTP/2)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+SPOTIFY_API_BASE = "https://api.spotify.com/v1"
+PAGE_SIZE = 100            # max items per /playlists/{id}/tracks page
+AUDIO_FEATURES_BATCH = 100  # max ids per /audio-features call
+TRACKS_BATCH = 50          # max ids per /tracks call
+MY_PLAYLISTS_PAGE_SIZE = 50  # max items per /me/playlists page
+
+logger = logging.getLogger(__name__)
+
+# `fields=` projections: only what create_dataframe_from_spotify_data reads,
+# instead of full track objects with album art, markets and external URLs
+PLAYLIST_FIELDS = "id,name,snapshot_id,owner(id),public"
+# Owner and visibility decide who sees the playlist in similarity results
+SNAPSHOT_FIELDS = "name,snapshot_id,owner(id),public"
+TRACK_ITEM_FIELDS = "total,items(track(id,name,popularity,duration_ms,explicit,artists(id,name),album(name)))"
+
+
+class ETagCache:
+    """
+    LRU of (ETag, parsed body) per request URL, for conditional GETs.
+
+    Keyed by URL only: Spotify checks the bearer token before answering
+    304, so a caller without access gets an error rather than our copy.
+    Cached bodies are shared between callers and must not be mutated.
+    Only playlist metadata goes in here: track pages are large, and an
+    unchanged playlist is already caught by its snapshot_id before any
+    page is fetched, so caching them costs memory for few hits.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Tuple[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, etag: str, body: Any):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (etag, body)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class TokenBucket:
+    """
+    Token bucket that hands out reservations: `reserve()` takes a token
+    (possibly going into debt) and returns how long the caller must wait
+    before using it. Single-threaded, so no lock is needed on the event loop.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def reserve(self, now: float) -> float:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class RateLimiter:
+    """
+    Request pacing for the Spotify client, plus a shared pause set from
+    Spotify's Retry-After so every request backs off together.
+
+    Spotify doesn't publish its limit (a rolling 30-second window per app),
+    so by default nothing is throttled up front. A 429 starts an app-wide
+    bucket at half the rate we were sending at (at most one cut per
+    `window`), and every `recovery_interval` without another cut the bucket
+    grows by a quarter until it's back at the rate that drew the 429, when
+    it is dropped again. Passing `app_rate` pins a fixed app bucket instead,
+    and `token_rate` adds one bucket per access token. Fixed rates are a
+    guess: set too low they throttle before Spotify would, set too high
+    they never bind.
+    """
+
+    def __init__(self, app_rate: Optional[float] = None, token_rate: Optional[float] = None,
+                 max_tokens_tracked: int = 1024, window: float = 30.0, recovery_interval: float = 30.0,
+                 min_rate: float = 1.0):
+        self.adaptive = not app_rate
+        self.app_bucket = None if self.adaptive else TokenBucket(app_rate, app_rate * 2)
+        self.token_rate = token_rate
+        self.max_tokens_tracked = max_tokens_tracked
+        self.window = window
+        self.recovery_interval = recovery_interval
+        self.min_rate = min_rate
+        self._token_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        # [whole second, requests sent in it] over the last `window`, so memory
+        # stays at about `window` entries however fast we send
+        self._sent: Deque[List[float]] = deque()
+        # Rate that drew the last 429; the adaptive bucket is dropped once it's back there
+        self.ceiling = 0.0
+        self.adjusted_at = float("-inf")
+        self.rate_cuts = 0
+        self.paused_until = 0.0
+
+    def _bucket_for(self, access_token: str) -> TokenBucket:
+        # Keyed by a digest so raw tokens aren't kept around
+        key = hashlib.sha256(access_token.encode()).hexdigest()
+        bucket = self._token_buckets.get(key)
+        if bucket is None:
+            bucket = self._token_buckets[key] = TokenBucket(self.token_rate, self.token_rate * 2)
+            while len(self._token_buckets) > self.max_tokens_tracked:
+                self._token_buckets.popitem(last=False)
+        self._token_buckets.move_to_end(key)
+        return bucket
+
+    def _trim(self, now: float):
+        while self._sent and now - self._sent[0][0] > self.window:
+            self._sent.popleft()
+
+    def _record_sent(self, now: float):
+        second = float(int(now))
+        if self._sent and self._sent[-1][0] == second:
+            self._sent[-1][1] += 1
+        else:
+            self._sent.append([second, 1])
+            self._trim(now)
+
+    def sending_rate(self, now: float) -> float:
+        """Requests per second over the last `window` (or since the first one in it)"""
+        self._trim(now)
+        if not self._sent:
+            return 0.0
+        return sum(count for _, count in self._sent) / max(1.0, now - self._sent[0][0])
+
+    def _recover(self, now: float):
+        bucket = self.app_bucket
+        if bucket is None or now - self.adjusted_at < self.recovery_interval:
+            return
+        self.adjusted_at = now
+        bucket.rate *= 1.25
+        bucket.capacity = bucket.rate * 2
+        if bucket.rate >= self.ceiling:
+            logger.info("🚦 Spotify rate back to %.1f/s without a 429; no longer throttling", bucket.rate)
+            self.app_bucket = None
+
+    async def acquire(self, access_token: str):
+        now = time.monotonic()
+        wait = self.paused_until - now
+        if self.adaptive:
+            self._recover(now)
+            self._record_sent(now)
+        if self.app_bucket is not None:
+            wait = max(wait, self.app_bucket.reserve(now))
+        if self.token_rate:
+            wait = max(wait, self._bucket_for(access_token).reserve(now))
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def slow_down(self):
+        """Spotify answered 429: cut the adaptive app rate in half, once per window"""
+        now = time.monotonic()
+        if not self.adaptive or now - self.adjusted_at < self.window:
+            return
+        rate = self.sending_rate(now)
+        if self.app_bucket is not None:
+            rate = min(rate, self.app_bucket.rate)
+        self.ceiling = rate
+        rate = max(self.min_rate, rate / 2)
+        if self.app_bucket is None:
+            self.app_bucket = TokenBucket(rate, rate * 2)
+        else:
+            self.app_bucket.rate = rate
+            self.app_bucket.capacity = rate * 2
+            self.app_bucket.tokens = min(self.app_bucket.tokens, self.app_bucket.capacity)
+        self.adjusted_at = now
+        self.rate_cuts += 1
+        logger.warning("🚦 Spotify returned 429; throttling to %.1f requests/s", rate)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            # 0 while nothing is throttling the app as a whole
+            "app_rate_limit": self.app_bucket.rate if self.app_bucket is not None else 0.0,
+            "sending_rate": self.sending_rate(time.monotonic()) if self.adaptive else 0.0,
+            "rate_cuts": self.rate_cuts,
+        }
+
+
+@dataclass
+class FetchReport:
+    """Per-request record of audio-feature batches that failed after retries"""
+    failed_batches: List[Dict[str, Any]] = field(default_factory=list)
+
+    def add_failure(self, batch_index: int, batch_size: int, reason: str):
+        self.failed_batches.append({"batch": batch_index, "tracks": batch_size, "reason": reason})
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "complete": not self.failed_batches,
+            "failed_feature_batches": self.failed_batches,
+            "tracks_missing_features": sum(batch["tracks"] for batch in self.failed_batches),
+        }
+
+
+def parse_retry_after(value: Optional[str], default: float = 1.0) -> float:
+    """Retry-After as seconds; Spotify sends delta-seconds, HTTP also allows a date"""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class SpotifyClient:
+    """
+    Pooled async Spotify Web API client.
+
+    One instance is shared by every request: it owns a single keep-alive
+    (HTTP/2 when available) connection pool, and fans out page and
+    audio-feature requests concurrently. `max_concurrency` caps requests in
+    flight across the whole client, not per call, so concurrent analyses
+    share it instead of multiplying it.
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None, base_url: str = SPOTIFY_API_BASE,
+                 transport: Optional[httpx.AsyncBaseTransport] = None,
+                 features_cache: Optional[AudioFeaturesCache] = None,
+                 rate_limiter: Optional[RateLimiter] = None, max_retries: Optional[int] = None):
+        if max_concurrency is None:
+            max_concurrency = int(os.getenv("SPOTIFY_MAX_CONCURRENCY", "16"))
+        if rate_limiter is None:
+            # Unset (the default) means adaptive: no limit until Spotify sends a 429
+            rate_limiter = RateLimiter(
+                app_rate=float(os.getenv("SPOTIFY_APP_RATE_PER_SEC") or 0) or None,
+                token_rate=float(os.getenv("SPOTIFY_TOKEN_RATE_PER_SEC") or 0) or None,
+            )
+        if max_retries is None:
+            max_retries = int(os.getenv("SPOTIFY_MAX_RETRIES", "4"))
+        self.max_concurrency = max(1, max_concurrency)
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self.base_url = base_url
+        self.features_cache = features_cache
+        self.rate_limiter = rate_limiter
+        self.max_retries = max(0, max_retries)
+        # Longest Retry-After we'll sit out before giving the 429 back to the caller
+        self.max_retry_after = float(os.getenv("SPOTIFY_MAX_RETRY_AFTER", "30"))
+        self.etags = ETagCache(int(os.getenv("SPOTIFY_ETAG_CACHE_SIZE", "2048")))
+
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.not_modified = 0
+        self.bytes_received = 0
+        self._http = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE and transport is None,
+            transport=transport,
+            headers={"Accept-Encoding": "gzip"},
+            timeout=httpx.Timeout(15.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+            ),
+        )
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    def _backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(8.0, 0.25 * 2 ** attempt))
+
+    async def _request(self, path: str, access_token: str, params: Optional[Dict[str, Any]] = None,
+                       headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        """
+        GET through the rate limiter and the client-wide concurrency slots,
+        retrying 429s after Retry-After and 5xx/connection errors with
+        jittered backoff. The final response is returned as-is (the caller
+        decides what a failure means).
+        """
+        attempt = 0
+        while True:
+            try:
+                # The slot is held for the request only, not across backoff sleeps
+                async with self._slots:
+                    await self.rate_limiter.acquire(access_token)
+                    self.requests += 1
+                    response = await self._http.get(
+                        f"{self.base_url}{path}",
+                        params=params,
+                        headers={"Authorization": f"Bearer {access_token}", **(headers or {})},
+                    )
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    raise
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+
+            if response.status_code == 429:
+                self.rate_limited += 1
+                self.rate_limiter.slow_down()
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if attempt >= self.max_retries or retry_after > self.max_retry_after:
+                    return response
+                # Rate limits are per app: everyone pauses, not just this request
+                self.rate_limiter.pause(retry_after)
+                self.retries += 1
+                attempt += 1
+                continue
+
+            if response.status_code >= 500 and attempt < self.max_retries:
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+
+            # Compressed size on the wire isn't exposed; count decoded bytes
+            self.bytes_received += len(response.content)
+            return response
+
+    async def _get_json(self, path: str, access_token: str, params: Optional[Dict[str, Any]] = None,
+                        revalidate: bool = False) -> Dict[str, Any]:
+        """
+        GET a JSON resource. With `revalidate`, the body is kept in the ETag
+        cache and later GETs send If-None-Match for it.
+        """
+        if not revalidate:
+            response = await self._request(path, access_token, params)
+            response.raise_for_status()
+            return response.json()
+
+        key = str(httpx.URL(f"{self.base_url}{path}", params=params))
+        cached = self.etags.get(key)
+        headers = {"If-None-Match": cached[0]} if cached else None
+
+        response = await self._request(path, access_token, params, headers)
+        if response.status_code == 304 and cached:
+            self.not_modified += 1
+            return cached[1]
+        response.raise_for_status()
+        body = response.json()
+        etag = response.headers.get("ETag")
+        if etag:
+            self.etags.put(key, etag, body)
+        return body
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "not_modified": self.not_modified,
+            "bytes_received": self.bytes_received,
+            **self.rate_limiter.stats(),
+        }
+
+    async def get_playlist(self, access_token: str, playlist_id: str) -> Dict[str, Any]:
+        """Playlist metadata we use (id, name, snapshot_id, owner and visibility)"""
+        return await self._get_json(f"/playlists/{playlist_id}", access_token, {"fields": PLAYLIST_FIELDS},
+                                    revalidate=True)
+
+    async def get_playlist_snapshot(self, access_token: str, playlist_id: str) -> Dict[str, Any]:
+        """The playlist's name, snapshot_id, owner and visibility: one small metadata call"""
+        return await self._get_json(f"/playlists/{playlist_id}", access_token, {"fields": SNAPSHOT_FIELDS},
+                                    revalidate=True)
+
+    async def _get_all_pages(self, path: str, access_token: str, params: Optional[Dict[str, Any]] = None,
+                             page_size: int = PAGE_SIZE) -> List[Dict[str, Any]]:
+        """
+        Every page of a paged playlist endpoint, in order.
+
+        The first page tells us `total`; every remaining offset is then
+        requested concurrently instead of following `next` links one by one.
+        """
+        params = dict(params or {}, limit=page_size)
+        first_page = await self._get_json(path, access_token, dict(params, offset=0))
+        total = first_page.get("total") or 0
+
+        rest = await asyncio.gather(*(
+            self._get_json(path, access_token, dict(params, offset=offset))
+            for offset in range(page_size, total, page_size)
+        ))
+        return [first_page, *rest]
+
+    async def get_playlist_tracks(self, access_token: str, playlist_id: str) -> List[Dict[str, Any]]:
+        """All track objects of a playlist, in playlist order"""
+        pages = await self._get_all_pages(
+            f"/playlists/{playlist_id}/tracks", access_token, {"fields": TRACK_ITEM_FIELDS}
+        )
+        tracks = []
+        for page in pages:
+            for item in page.get("items", []):
+                if item.get("track"):  # Skip null tracks
+                    tracks.append(item["track"])
+        return tracks
+
+    async def get_playlist_track_ids(self, access_token: str, playlist_id: str) -> List[str]:
+        """Track IDs of a playlist in order, fetched with an ID-only field projection"""
+        pages = await self._get_all_pages(
+            f"/playlists/{playlist_id}/tracks", access_token, {"fields": "total,items(track(id))"}
+        )
+        return [
+            item["track"]["id"]
+            for page in pages
+            for item in page.get("items", [])
+            if item.get("track") and item["track"].get("id")
+        ]
+
+    async def get_my_playlist_ids(self, access_token: str) -> List[str]:
+        """IDs of every playlist in the current user's library"""
+        pages = await self._get_all_pages("/me/playlists", access_token, page_size=MY_PLAYLISTS_PAGE_SIZE)
+        return [playlist["id"] for page in pages for playlist in page.get("items", []) if playlist]
+
+    async def get_tracks(self, access_token: str, track_ids: List[str]) -> List[Dict[str, Any]]:
+        """Full track objects for specific IDs, in concurrent 50-ID batches"""
+        async def fetch_batch(batch_ids: List[str]) -> List[Dict[str, Any]]:
+            data = await self._get_json("/tracks", access_token, {"ids": ",".join(batch_ids)})
+            return [track for track in data.get("tracks", []) if track]
+
+        batches = await asyncio.gather(*(
+            fetch_batch(track_ids[i:i + TRACKS_BATCH]) for i in range(0, len(track_ids), TRACKS_BATCH)
+        ))
+        return [track for batch in batches for track in batch]
+
+    async def get_audio_features(self, access_token: str, track_ids: List[str],
+                                 report: Optional[FetchReport] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Audio features keyed by track ID, fetched in concurrent 100-ID batches.
+
+        IDs found in the features cache are not requested again; only the
+        misses are packed into batches. Tracks Spotify answers null for are
+        cached as such and left out of the result. Batches that still fail
+        after retries are skipped (their tracks get zeroed features) and
+        recorded in `report` so the response can say the analysis is partial.
+        """
+        unique_ids = list(dict.fromkeys(track_ids))
+        audio_features_map = {}
+        if self.features_cache is not None:
+            audio_features_map = await asyncio.to_thread(self.features_cache.get_many, unique_ids)
+        missing_ids = [track_id for track_id in unique_ids if track_id not in audio_features_map]
+
+        batches = [missing_ids[i:i + AUDIO_FEATURES_BATCH] for i in range(0, len(missing_ids), AUDIO_FEATURES_BATCH)]
+
+        async def fetch_batch(batch_index: int, batch_ids: List[str]) -> Optional[List[Dict[str, Any]]]:
+            try:
+                response = await self._request("/audio-features", access_token, {"ids": ",".join(batch_ids)})
+            except httpx.TransportError as e:
+                reason = f"{type(e).__name__}: {e}"
+            else:
+                if response.status_code == 200:
+                    return response.json().get("audio_features", [])
+                reason = f"HTTP {response.status_code}"
+            logger.warning("❌ Failed to fetch audio features batch %d: %s", batch_index, reason)
+            if report is not None:
+                report.add_failure(batch_index, len(batch_ids), reason)
+            return None
+
+        fetched: Dict[str, Optional[Dict[str, Any]]] = {}
+        results = await asyncio.gather(*(fetch_batch(i, batch) for i, batch in enumerate(batches)))
+        for batch_ids, features in zip(batches, results):
+            if features is None:
+                continue
+            # Every ID of an answered batch gets an entry, None where Spotify returned null
+            fetched.update(dict.fromkeys(batch_ids))
+            for feature in features:
+                if feature:
+                    fetched[feature["id"]] = feature
+
+        if self.features_cache is not None:
+            self.features_cache.record_lookup(len(unique_ids), len(missing_ids), AUDIO_FEATURES_BATCH)
+            await asyncio.to_thread(self.features_cache.put_many, fetched)
+
+        audio_features_map.update(fetched)
+        return {track_id: features for track_id, features in audio_features_map.items() if features is not None}
+
+    async def iter_playlist_pages(self, access_token: str, playlist_id: str, report: Optional[FetchReport] = None
+                                  ) -> AsyncIterator[Tuple[int, int, List[Dict[str, Any]], Dict[str, Dict[str, Any]]]]:
+        """
+        Yield (offset, total, tracks, audio_features_map) for each page as soon
+        as it and its audio features have arrived.
+
+        The first page comes first (it carries `total`); the rest are fetched
+        concurrently and yielded in completion order, not playlist order.
+        Only `max_concurrency` pages are in progress at a time, so a page's
+        audio-feature batch doesn't queue behind every later page's fetch.
+        """
+        path = f"/playlists/{playlist_id}/tracks"
+
+        async def fetch_page(offset: int):
+            page = await self._get_json(
+                path, access_token, {"fields": TRACK_ITEM_FIELDS, "limit": PAGE_SIZE, "offset": offset}
+            )
+            tracks = [item["track"] for item in page.get("items", []) if item.get("track")]
+            features = await self.get_audio_features(access_token, [t["id"] for t in tracks if t.get("id")], report)
+            return offset, page.get("total") or 0, tracks, features
+
+        first = await fetch_page(0)
+        total = first[1]
+        yield first
+
+        offsets = iter(range(PAGE_SIZE, total, PAGE_SIZE))
+        pending = {asyncio.ensure_future(fetch_page(offset)) for offset in islice(offsets, self.max_concurrency)}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                pending |= {asyncio.ensure_future(fetch_page(offset)) for offset in islice(offsets, len(done))}
+                for task in done:
+                    offset, _, tracks, features = task.result()
+                    yield offset, total, tracks, features
+        finally:
+            # Consumer stopped early (client disconnected, error): drop the rest
+            for task in pending:
+                task.cancel()
+
+    async def get_playlist_with_features(self, access_token: str, playlist_id: str, report: Optional[FetchReport] = None,
+                                         playlist_data: Optional[Dict[str, Any]] = None
+                                         ) -> Tuple[Dict[str, Any], List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+        """
+        Metadata, tracks and audio features for one playlist. Pass
+        `playlist_data` when the metadata was already fetched to skip that call.
+        """
+        if playlist_data is None:
+            playlist_data, tracks = await asyncio.gather(
+                self.get_playlist(access_token, playlist_id),
+                self.get_playlist_tracks(access_token, playlist_id),
+            )
+        else:
+            tracks = await self.get_playlist_tracks(access_token, playlist_id)
+        track_ids = [track["id"] for track in tracks if track.get("id")]
+        audio_features_map = await self.get_audio_features(access_token, track_ids, report)
+        return playlist_data, tracks, audio_features_map
+
+
+# Shared instance, created on first use and reused across requests; the
+# FastAPI lifespan only closes it on shutdown
+_client: Optional[SpotifyClient] = None
+
+
+def get_spotify_client() -> SpotifyClient:
+    """Return the shared client, creating it on first use"""
+    global _client
+    if _client is None:
+        _client = SpotifyClient(features_cache=get_audio_features_cache())
+    return _client
+
+
+async def close_spotify_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
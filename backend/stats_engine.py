@@ -0,0 +1,251 @@
+# stats_engine.py
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from track_schema import ARTISTS_COLUMN, split_artist_names
+
+AUDIO_FEATURES = ['Danceability', 'Energy', 'Valence', 'Acousticness',
+                  'Instrumentalness', 'Liveness', 'Speechiness', 'Tempo']
+
+# Columns folded into the moment arrays, in matrix column order
+NUMERIC_COLUMNS = ['Popularity', 'Duration (ms)', 'Explicit'] + AUDIO_FEATURES
+
+
+class PlaylistStats:
+    """
+    Mergeable partial aggregates for a set of tracks.
+
+    Holds per-column count/mean/M2 moments, min/max and artist/album count
+    maps. Artists are counted individually, keyed by Spotify artist ID, so
+    a collaboration counts towards each credited artist. Partials built
+    from separate chunks or pages combine with `merge()` (Chan et al.
+    parallel variance), so a playlist never has to be in memory all at once
+    to get exact means and sample stds.
+    """
+
+    def __init__(self, columns: Optional[List[str]] = None):
+        self.columns = list(columns) if columns is not None else []
+        k = len(NUMERIC_COLUMNS)
+        self.track_count = 0
+        self.count = np.zeros(k, dtype=np.int64)
+        self.mean = np.zeros(k, dtype=np.float64)
+        self.m2 = np.zeros(k, dtype=np.float64)
+        self.minimum = np.full(k, np.inf)
+        self.maximum = np.full(k, -np.inf)
+        self.has_artists = False
+        # key -> occurrences; plain Counters so a merge costs the size of the
+        # incoming partial, not of everything merged so far
+        self.artist_counts: Counter = Counter()
+        self.album_counts: Counter = Counter()
+        # artist key -> display name, for the keys in artist_counts
+        self.artist_names: Dict[str, str] = {}
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> "PlaylistStats":
+        """Compute every aggregate for `df` in one vectorized pass"""
+        stats = cls([column for column in NUMERIC_COLUMNS if column in df.columns])
+        stats.track_count = len(df)
+        stats.has_artists = ARTISTS_COLUMN in df.columns or 'Artist Name(s)' in df.columns
+        if len(df) == 0:
+            return stats
+
+        # Column-major so each column is written (and later reduced) contiguously
+        matrix = np.full((len(NUMERIC_COLUMNS), len(df)), np.nan)
+        for i, column in enumerate(NUMERIC_COLUMNS):
+            if column not in df.columns:
+                continue
+            values = df[column]
+            if column == 'Explicit' and values.dtype != 'bool':
+                # Handle string values like 'True'/'False'
+                values = values.astype(str).str.lower() == 'true'
+            matrix[i] = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+        stats.add_matrix(matrix.T)
+        if stats.has_artists:
+            stats.artist_counts, stats.artist_names = _artist_counts(df)
+        if 'Album Name' in df.columns:
+            stats.album_counts = _value_counts(df['Album Name'])
+        return stats
+
+    def add_matrix(self, matrix: np.ndarray):
+        """Fold a (tracks x NUMERIC_COLUMNS) matrix into the moments; NaNs are skipped"""
+        # Reduce along contiguous rows: one row per column
+        values = np.ascontiguousarray(matrix.T)
+        other = PlaylistStats(self.columns)
+        missing = np.isnan(values)
+        if missing.any():
+            other.count = values.shape[1] - missing.sum(axis=1)
+            values = np.where(missing, 0.0, values)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                other.mean = np.where(other.count > 0, values.sum(axis=1) / other.count, 0.0)
+            centered = np.where(missing, 0.0, values - other.mean[:, None])
+            other.minimum = np.where(missing, np.inf, values).min(axis=1)
+            other.maximum = np.where(missing, -np.inf, values).max(axis=1)
+        else:
+            other.count = np.full(len(values), values.shape[1], dtype=np.int64)
+            other.mean = values.mean(axis=1)
+            centered = values - other.mean[:, None]
+            other.minimum = values.min(axis=1)
+            other.maximum = values.max(axis=1)
+        other.m2 = np.einsum('ij,ij->i', centered, centered)
+        self._merge_moments(other)
+
+    def _merge_moments(self, other: "PlaylistStats"):
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.mean = np.where(n > 0, self.mean + delta * other.count / n, 0.0)
+            self.m2 = np.where(n > 0, self.m2 + other.m2 + delta ** 2 * self.count * other.count / n, 0.0)
+        self.count = n
+        self.minimum = np.minimum(self.minimum, other.minimum)
+        self.maximum = np.maximum(self.maximum, other.maximum)
+
+    def merge(self, other: "PlaylistStats") -> "PlaylistStats":
+        """Fold another partial into this one (in place) and return self"""
+        self._merge_moments(other)
+        self.track_count += other.track_count
+        self.has_artists = self.has_artists or other.has_artists
+        self.artist_counts.update(other.artist_counts)
+        self.artist_names.update(other.artist_names)
+        self.album_counts.update(other.album_counts)
+        for column in other.columns:
+            if column not in self.columns:
+                self.columns.append(column)
+        return self
+
+    def subtract(self, other: "PlaylistStats") -> "PlaylistStats":
+        """
+        Remove a partial previously merged into this one (in place) and return self.
+
+        Moments and count maps are exactly reversible; min/max are not, so
+        they are left as outer bounds of what remains.
+        """
+        n = self.count - other.count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(n > 0, (self.mean * self.count - other.mean * other.count) / n, 0.0)
+            delta = other.mean - mean
+            m2 = np.where(n > 0, self.m2 - other.m2 - delta ** 2 * n * other.count / self.count, 0.0)
+        self.count = n
+        self.mean = mean
+        self.m2 = np.maximum(m2, 0.0)
+        self.track_count -= other.track_count
+        _subtract_counts(self.artist_counts, other.artist_counts)
+        _subtract_counts(self.album_counts, other.album_counts)
+        return self
+
+    def __setstate__(self, state: Dict[str, Any]):
+        # States pickled before the counts were Counters hold pandas Series
+        for name in ('artist_counts', 'album_counts'):
+            if isinstance(state.get(name), pd.Series):
+                state[name] = Counter(state[name].to_dict())
+        self.__dict__.update(state)
+
+    def finalize(self) -> Dict[str, Any]:
+        """The `generate_basic_analysis` result dict for everything merged so far"""
+        def column_mean(column):
+            i = NUMERIC_COLUMNS.index(column)
+            return float(self.mean[i]) if self.count[i] > 0 else 0
+
+        def column_std(column):
+            # Sample std (ddof=1), matching pandas
+            i = NUMERIC_COLUMNS.index(column)
+            return float(np.sqrt(self.m2[i] / (self.count[i] - 1))) if self.count[i] > 1 else 0
+
+        duration_index = NUMERIC_COLUMNS.index('Duration (ms)')
+        analysis = {
+            "track_count": self.track_count,
+            "artists_count": len(self.artist_counts),
+            "albums_count": len(self.album_counts),
+            "avg_popularity": column_mean('Popularity') if 'Popularity' in self.columns else 0,
+            "duration_minutes": (float(self.mean[duration_index] * self.count[duration_index]) / 60000)
+                                if 'Duration (ms)' in self.columns else 0,
+        }
+        if 'Explicit' in self.columns:
+            analysis["explicit_ratio"] = column_mean('Explicit')
+
+        for feature in AUDIO_FEATURES:
+            if feature in self.columns:
+                analysis[f'avg_{feature.lower()}'] = column_mean(feature)
+                analysis[f'std_{feature.lower()}'] = column_std(feature)
+
+        if self.has_artists:
+            top_artists: Dict[str, int] = {}
+            # most_common keeps first-seen order among ties, like Series.nlargest
+            for key, count in self.artist_counts.most_common(10):
+                # Distinct artists sharing a name are reported together
+                name = self.artist_names.get(key, key)
+                top_artists[name] = top_artists.get(name, 0) + int(count)
+            analysis['top_artists'] = top_artists
+        return analysis
+
+
+def merge_stats(parts: Iterable[PlaylistStats]) -> PlaylistStats:
+    """Combine per-chunk or per-page partials into one"""
+    merged = PlaylistStats()
+    for part in parts:
+        merged.merge(part)
+    return merged
+
+
+def _subtract_counts(counts: Counter, removed: Counter):
+    """Take `removed` out of `counts` in place, dropping keys that reach zero"""
+    for key, count in removed.items():
+        remaining = counts.get(key, 0) - count
+        if remaining > 0:
+            counts[key] = remaining
+        else:
+            counts.pop(key, None)
+
+
+def _codes(series: pd.Series) -> Tuple[np.ndarray, pd.Index]:
+    """(integer code per row, distinct values); missing values get code -1"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), series.cat.categories
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    return codes, pd.Index(uniques, dtype=object, tupleize_cols=False)
+
+
+def _value_counts(series: pd.Series) -> Counter:
+    """Occurrence counts via integer codes + bincount instead of string hashing per row"""
+    codes, categories = _codes(series)
+    counts = np.bincount(codes[codes >= 0], minlength=len(categories))
+    present = counts > 0
+    return Counter(dict(zip(categories[present].tolist(), counts[present].tolist())))
+
+
+def _artist_counts(df: pd.DataFrame) -> Tuple[Counter, Dict[str, str]]:
+    """
+    Tracks per individual artist, keyed by artist ID, plus the keys' names.
+
+    Tracks are coded by their distinct artist set, and only those sets are
+    exploded into (set -> artist code) arrays; one weighted bincount then
+    adds each set's track count to every artist in it. No per-row strings
+    are split or hashed.
+    """
+    if ARTISTS_COLUMN in df.columns:
+        codes, artist_sets = _codes(df[ARTISTS_COLUMN])
+        artist_sets = artist_sets.tolist()
+    else:
+        # CSV uploads only have the joined names
+        codes, joined = _codes(df['Artist Name(s)'])
+        artist_sets = [split_artist_names(str(value)) for value in joined]
+
+    keys: Dict[str, int] = {}
+    names: Dict[str, str] = {}
+    members: List[int] = []
+    for artists in artist_sets:
+        for key, name in artists:
+            code = keys.get(key)
+            if code is None:
+                code = keys[key] = len(keys)
+                names[key] = name
+            members.append(code)
+    set_sizes = np.fromiter(map(len, artist_sets), dtype=np.int64, count=len(artist_sets))
+    tracks_per_set = np.bincount(codes[codes >= 0], minlength=len(artist_sets))
+
+    counts = np.bincount(np.asarray(members, dtype=np.int64), weights=np.repeat(tracks_per_set, set_sizes),
+                         minlength=len(keys)).astype(np.int64)
+    return Counter({key: count for key, count in zip(keys, counts.tolist()) if count > 0}), names
@@ -0,0 +1,18 @@
+# conftest.py
+import os
+import sys
+
+import pytest
+
+# The backend modules are imported top-level (as uvicorn runs them from backend/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from track_factory import make_tracks  # noqa: E402
+
+
+@pytest.fixture
+def playlist_df():
+    from track_table import TrackTable
+
+    tracks, audio_features_map = make_tracks(240)
+    return TrackTable.from_spotify(tracks, audio_features_map).to_dataframe()
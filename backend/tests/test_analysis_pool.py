@@ -0,0 +1,35 @@
+# test_analysis_pool.py
+import asyncio
+
+import pytest
+
+from analysis_pool import AnalysisPool
+from metrics import STAGE_ERRORS, STAGE_SECONDS, stage
+
+
+def timed_job(value):
+    with stage("test_worker_job"):
+        return value * 2
+
+
+def failing_job():
+    with stage("test_worker_failure"):
+        raise ValueError("bad input")
+
+
+def stage_count(name):
+    return STAGE_SECONDS.totals().get((("stage", name),), (0, 0.0))[0]
+
+
+def test_process_workers_report_their_stage_timings():
+    pool = AnalysisPool("process", max_workers=1, max_queue=1)
+    try:
+        assert asyncio.run(pool.run(timed_job, 21)) == 42
+        assert stage_count("test_worker_job") == 1
+
+        with pytest.raises(ValueError, match="bad input"):
+            asyncio.run(pool.run(failing_job))
+        assert stage_count("test_worker_failure") == 1
+        assert any("test_worker_failure" in line for line in STAGE_ERRORS.render())
+    finally:
+        pool.shutdown()
@@ -0,0 +1,62 @@
+# test_analysis_state.py
+from collections import Counter
+
+import pandas as pd
+
+from analysis_state import diff_track_ids, select_removed_rows
+from stats_engine import PlaylistStats
+from track_table import TrackTable
+
+from track_factory import make_tracks
+
+
+def test_diff_counts_duplicate_tracks():
+    added, removed = diff_track_ids(["a", "b", "b", "c"], ["b", "c", "c", "d"])
+    assert added == Counter({"c": 1, "d": 1})
+    assert removed == Counter({"a": 1, "b": 1})
+
+
+def test_diff_of_reordered_playlist_is_empty():
+    added, removed = diff_track_ids(["a", "b", "a"], ["a", "a", "b"])
+    assert not added and not removed
+
+
+def test_select_removed_rows_takes_only_the_removed_occurrences():
+    tracks = pd.DataFrame({"Track ID": ["a", "b", "a", "c", "a"]})
+    mask = select_removed_rows(tracks, Counter({"a": 2, "c": 1}))
+    assert mask.tolist() == [True, False, True, True, False]
+
+
+def test_select_removed_rows_with_nothing_removed():
+    tracks = pd.DataFrame({"Track ID": ["a", "b"]})
+    assert not select_removed_rows(tracks, Counter()).any()
+
+
+def test_incremental_update_matches_full_recompute():
+    tracks, audio_features_map = make_tracks(150)
+    # The old playlist has a duplicated track; the new one drops one copy,
+    # drops some other tracks and adds new ones
+    old = tracks[:100] + [tracks[3]]
+    new = tracks[10:100] + tracks[100:150] + [tracks[3]]
+    old_df = TrackTable.from_spotify(old, audio_features_map).to_dataframe()
+    new_df = TrackTable.from_spotify(new, audio_features_map).to_dataframe()
+
+    added, removed = diff_track_ids(old_df["Track ID"].tolist(), new_df["Track ID"].tolist())
+    tracks_by_id = {track["id"]: track for track in tracks}
+    added_df = TrackTable.from_spotify([tracks_by_id[track_id] for track_id in added.elements()],
+                                       audio_features_map).to_dataframe()
+    removed_mask = select_removed_rows(old_df, removed)
+    assert removed_mask.sum() == 10
+
+    stats = PlaylistStats.from_dataframe(old_df)
+    stats.subtract(PlaylistStats.from_dataframe(old_df[removed_mask]))
+    stats.merge(PlaylistStats.from_dataframe(added_df))
+
+    expected = PlaylistStats.from_dataframe(new_df)
+    actual, wanted = stats.finalize(), expected.finalize()
+    assert stats.artist_counts == expected.artist_counts
+    assert stats.album_counts == expected.album_counts
+    for key in ("track_count", "artists_count", "albums_count"):
+        assert actual[key] == wanted[key]
+    for key in ("avg_popularity", "duration_minutes", "avg_energy", "std_energy", "std_tempo"):
+        assert abs(actual[key] - wanted[key]) < 1e-9
@@ -0,0 +1,93 @@
+# test_report_cache.py
+import asyncio
+
+import pytest
+
+from report_cache import ReportCache
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_concurrent_requests_share_one_completion():
+    cache = ReportCache(max_entries=8, ttl_seconds=60)
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "report"
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute("key", compute) for _ in range(5)))
+
+    assert run(main()) == ["report"] * 5
+    assert calls == 1
+    assert cache.stats()["misses"] == 1 and cache.stats()["coalesced"] == 4
+    # Later lookups are served from the cache
+    assert run(cache.get_or_compute("key", compute)) == "report"
+    assert calls == 1 and cache.stats()["hits"] == 1
+
+
+def test_failure_reaches_every_waiter_and_is_not_cached():
+    cache = ReportCache(max_entries=8, ttl_seconds=60)
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute("key", failing) for _ in range(3)),
+                                    return_exceptions=True)
+
+    results = run(main())
+    assert calls == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert cache.get("key") is None and cache.stats()["inflight"] == 0
+
+    async def succeed():
+        return "report"
+
+    # The next request computes again instead of replaying the failure
+    assert run(cache.get_or_compute("key", succeed)) == "report"
+
+
+def test_owner_cancelled_does_not_cancel_waiters():
+    cache = ReportCache(max_entries=8, ttl_seconds=60)
+
+    async def compute():
+        await asyncio.sleep(0.02)
+        return "report"
+
+    async def main():
+        owner = asyncio.ensure_future(cache.get_or_compute("key", compute))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(cache.get_or_compute("key", compute))
+        await asyncio.sleep(0)
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        return await waiter
+
+    assert run(main()) == "report"
+
+
+def test_expired_entries_are_recomputed():
+    cache = ReportCache(max_entries=8, ttl_seconds=-1)
+    cache.put("key", "stale")
+    assert cache.get("key") is None
+
+
+def test_entries_are_bounded_lru():
+    cache = ReportCache(max_entries=2, ttl_seconds=60)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
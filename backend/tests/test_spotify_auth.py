@@ -0,0 +1,71 @@
+# test_spotify_auth.py
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from spotify_auth import SpotifyAuth, SpotifyAuthError
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def make_auth():
+    """SpotifyAuth against a token endpoint that issues tok-1, tok-2, ... with rotating refresh tokens"""
+    issued = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal issued
+        if request.url.path.endswith("/me"):
+            return httpx.Response(200, json={"id": "user-1"})
+        issued += 1
+        return httpx.Response(200, json={"access_token": f"tok-{issued}", "token_type": "Bearer",
+                                         "expires_in": 3600, "refresh_token": f"refresh-{issued}"})
+
+    return SpotifyAuth(transport=httpx.MockTransport(handler))
+
+
+def test_token_near_expiry_is_refreshed():
+    auth = make_auth()
+
+    async def main():
+        await auth.exchange_code("code")
+        auth._tokens["tok-1"].expires_at = time.time() + 60
+        auth._sessions["user-1"].expires_at = time.time() + 60
+        return await auth.ensure_valid("tok-1")
+
+    token, session = run(main())
+    assert token == "tok-2" and session.refresh_token == "refresh-2"
+
+
+def test_expired_token_is_not_swapped_for_the_refreshed_session():
+    auth = make_auth()
+
+    async def main():
+        await auth.exchange_code("code")
+        # The user has a fresh session, but this token lapsed a day ago
+        auth._sessions["user-1"] = auth._start_session(
+            {"access_token": "tok-new", "expires_in": 3600, "refresh_token": "refresh-new"}, "user-1"
+        )
+        auth._tokens["tok-1"].expires_at = time.time() - 86400
+        return await auth.ensure_valid("tok-1")
+
+    with pytest.raises(SpotifyAuthError) as excinfo:
+        run(main())
+    assert excinfo.value.status_code == 401
+    assert auth.stats()["rejected"] == 1 and auth.stats()["refreshes"] == 0
+
+
+def test_expired_token_without_a_session_is_rejected():
+    auth = make_auth()
+
+    async def main():
+        await auth.exchange_code("code")
+        auth._sessions.clear()
+        auth._tokens["tok-1"].expires_at = time.time() - 1
+        return await auth.ensure_valid("tok-1")
+
+    with pytest.raises(SpotifyAuthError):
+        run(main())
@@ -0,0 +1,64 @@
+# test_stats_engine.py
+import numpy as np
+import pytest
+
+from stats_engine import PlaylistStats, merge_stats
+
+
+def assert_same_analysis(actual, expected):
+    assert actual.keys() == expected.keys()
+    for key, value in expected.items():
+        if key == "top_artists":
+            # Ties may come out in a different order after merging
+            assert sorted(actual[key].items()) == sorted(value.items())
+        else:
+            assert actual[key] == pytest.approx(value, rel=1e-9, abs=1e-12), key
+
+
+def test_merged_chunks_match_whole_playlist(playlist_df):
+    chunks = [playlist_df.iloc[i:i + 100] for i in range(0, len(playlist_df), 100)]
+    merged = merge_stats(PlaylistStats.from_dataframe(chunk) for chunk in chunks)
+    assert_same_analysis(merged.finalize(), PlaylistStats.from_dataframe(playlist_df).finalize())
+
+
+def test_merge_with_empty_partial_is_a_no_op(playlist_df):
+    stats = PlaylistStats.from_dataframe(playlist_df)
+    expected = stats.finalize()
+    stats.merge(PlaylistStats.from_dataframe(playlist_df.iloc[:0]))
+    assert_same_analysis(stats.finalize(), expected)
+
+
+def test_subtract_undoes_merge(playlist_df):
+    kept, removed = playlist_df.iloc[:150], playlist_df.iloc[150:]
+    stats = PlaylistStats.from_dataframe(playlist_df)
+    stats.subtract(PlaylistStats.from_dataframe(removed))
+
+    expected = PlaylistStats.from_dataframe(kept)
+    assert_same_analysis(stats.finalize(), expected.finalize())
+    # Artists and albums whose count drops to zero are gone, not kept at 0
+    assert stats.artist_counts == expected.artist_counts
+    assert stats.album_counts == expected.album_counts
+
+
+def test_subtract_everything_leaves_empty_moments(playlist_df):
+    stats = PlaylistStats.from_dataframe(playlist_df)
+    stats.subtract(PlaylistStats.from_dataframe(playlist_df))
+    assert stats.track_count == 0
+    assert not stats.artist_counts and not stats.album_counts
+    assert np.all(stats.count == 0) and np.all(stats.m2 == 0)
+
+
+def test_collaborations_count_for_each_artist(playlist_df):
+    stats = PlaylistStats.from_dataframe(playlist_df)
+    credits = sum(len(artists) for artists in playlist_df["Artists"])
+    assert sum(stats.artist_counts.values()) == credits
+
+
+def test_missing_values_are_skipped_in_merged_moments(playlist_df):
+    df = playlist_df.copy()
+    df["Energy"] = df["Energy"].astype("float64")
+    df.loc[df.index[::7], "Energy"] = np.nan
+    merged = merge_stats(PlaylistStats.from_dataframe(df.iloc[i:i + 60]) for i in range(0, len(df), 60))
+    finalized = merged.finalize()
+    assert finalized["avg_energy"] == pytest.approx(df["Energy"].mean())
+    assert finalized["std_energy"] == pytest.approx(df["Energy"].std())
@@ -0,0 +1,36 @@
+# track_factory.py
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+
+def make_tracks(n_tracks: int, seed: int = 0) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """(tracks, audio_features_map) shaped like the Spotify client's output, with collaborations"""
+    rng = np.random.default_rng(seed)
+    tracks = []
+    audio_features_map = {}
+    for i in range(n_tracks):
+        artist = int(rng.integers(0, 12))
+        artists = [{"id": f"a{artist}", "name": f"Artist {artist}"}]
+        if rng.random() < 0.3:
+            artists.append({"id": f"a{(artist + 5) % 12}", "name": f"Artist {(artist + 5) % 12}"})
+        track_id = f"t{i}"
+        tracks.append({
+            "id": track_id,
+            "name": f"Track {i}",
+            "artists": artists,
+            "album": {"name": f"Album {int(rng.integers(0, 8))}"},
+            "popularity": int(rng.integers(0, 101)),
+            "duration_ms": int(rng.integers(90_000, 400_000)),
+            "explicit": bool(rng.random() < 0.3),
+        })
+        # Some tracks have no features, as when Spotify answers null
+        if rng.random() < 0.9:
+            features = rng.random(7)
+            audio_features_map[track_id] = {
+                "id": track_id,
+                "danceability": features[0], "energy": features[1], "valence": features[2],
+                "acousticness": features[3], "instrumentalness": features[4], "liveness": features[5],
+                "speechiness": features[6], "tempo": float(rng.uniform(60, 200)),
+            }
+    return tracks, audio_features_map
@@ -0,0 +1,59 @@
+# track_schema.py
+import math
+from typing import Any, Dict, Tuple
+
+# Column layout shared by the NumPy track table and the pure-Python fast
+# path; kept free of heavy imports so either can use it.
+
+# (DataFrame column, Spotify audio-features key), in feature-matrix row order
+AUDIO_FEATURE_COLUMNS = [
+    ("Danceability", "danceability"),
+    ("Energy", "energy"),
+    ("Valence", "valence"),
+    ("Acousticness", "acousticness"),
+    ("Instrumentalness", "instrumentalness"),
+    ("Liveness", "liveness"),
+    ("Speechiness", "speechiness"),
+    ("Tempo", "tempo"),
+]
+
+TRACK_COLUMNS = [
+    "Track Name", "Artist Name(s)", "Album Name", "Track ID", "Popularity",
+    "Duration (ms)", "Explicit", "Danceability", "Energy", "Valence",
+    "Acousticness", "Instrumentalness", "Liveness", "Speechiness", "Tempo", "Artists"
+]
+
+# Per track, the tuple of (artist key, artist name) pairs it credits. The key
+# is the Spotify artist ID, or the name where there is none (local files,
+# CSV uploads). Unlike the joined "Artist Name(s)" string, this counts a
+# collaboration towards each of its artists.
+ARTISTS_COLUMN = "Artists"
+
+ArtistSet = Tuple[Tuple[str, str], ...]
+
+
+def artist_set(track: Dict[str, Any]) -> ArtistSet:
+    """A Spotify track object's artists as (key, name) pairs, in credit order"""
+    return tuple(
+        (artist.get('id') or artist['name'], artist['name'])
+        for artist in track.get('artists') or []
+        if isinstance(artist, dict) and 'name' in artist
+    )
+
+
+def split_artist_names(joined: str) -> ArtistSet:
+    """(name, name) pairs from a joined "Artist Name(s)" value, for sources without artist IDs"""
+    # Exportify joins with "," and the Spotify path with ", "; a name that
+    # itself contains a comma is split in two, which IDs avoid
+    return tuple((name, name) for name in (part.strip() for part in joined.split(",")) if name)
+
+
+def safe_number(value, default=0.0) -> float:
+    """Convert value to float, handling None and NaN"""
+    if value is None:
+        return default
+    try:
+        float_val = float(value)
+        return default if math.isnan(float_val) else float_val
+    except (ValueError, TypeError):
+        return default
@@ -0,0 +1,117 @@
+# track_table.py
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from track_schema import ARTISTS_COLUMN, AUDIO_FEATURE_COLUMNS, TRACK_COLUMNS, ArtistSet, artist_set, safe_number
+
+
+class TrackTable:
+    """
+    Columnar, array-backed store for a playlist's tracks.
+
+    Every column is a preallocated typed NumPy array; artist and album names
+    are interned into integer codes, and so is each track's set of credited
+    artists (by Spotify artist ID), which statistics explode per artist.
+    `to_dataframe()` wraps the arrays in an Exportify-shaped DataFrame
+    without copying them.
+    """
+
+    def __init__(self, capacity: int):
+        self.size = 0
+        self.track_names = np.empty(capacity, dtype=object)
+        self.track_ids = np.empty(capacity, dtype=object)
+        self.artist_codes = np.empty(capacity, dtype=np.int32)
+        self.album_codes = np.empty(capacity, dtype=np.int32)
+        self.artist_set_codes = np.empty(capacity, dtype=np.int32)
+        self.popularity = np.zeros(capacity, dtype=np.int16)
+        self.duration_ms = np.zeros(capacity, dtype=np.int32)
+        self.explicit = np.zeros(capacity, dtype=bool)
+        # One contiguous row per audio feature, so each DataFrame column is a view
+        self.features = np.zeros((len(AUDIO_FEATURE_COLUMNS), capacity), dtype=np.float32)
+        self.artist_names: List[str] = []
+        self.album_names: List[str] = []
+        self.artist_sets: List[ArtistSet] = []
+
+    @classmethod
+    def from_spotify(cls, tracks: List[Dict[str, Any]], audio_features_map: Dict[str, Dict[str, Any]]) -> "TrackTable":
+        """Fill the table in one pass over Spotify track objects and their audio features"""
+        table = cls(len(tracks))
+        artist_lookup: Dict[str, int] = {}
+        album_lookup: Dict[str, int] = {}
+        artist_set_lookup: Dict[ArtistSet, int] = {}
+        set_name_codes: List[int] = []
+        feature_keys = [key for _, key in AUDIO_FEATURE_COLUMNS]
+        features = table.features
+
+        row = 0
+        for track in tracks:
+            if not track or not track.get('id'):
+                continue
+            track_id = track['id']
+
+            artists = artist_set(track)
+            code = artist_set_lookup.get(artists)
+            if code is None:
+                code = artist_set_lookup[artists] = len(table.artist_sets)
+                table.artist_sets.append(artists)
+                # The joined display name is built once per distinct artist set
+                artist_name = ", ".join(name for _, name in artists)
+                name_code = artist_lookup.get(artist_name)
+                if name_code is None:
+                    name_code = artist_lookup[artist_name] = len(table.artist_names)
+                    table.artist_names.append(artist_name)
+                set_name_codes.append(name_code)
+            table.artist_set_codes[row] = code
+            table.artist_codes[row] = set_name_codes[code]
+
+            album = track.get('album')
+            album_name = album.get('name', '') if isinstance(album, dict) else ''
+            code = album_lookup.get(album_name)
+            if code is None:
+                code = album_lookup[album_name] = len(table.album_names)
+                table.album_names.append(album_name)
+            table.album_codes[row] = code
+
+            table.track_names[row] = track.get('name', '')
+            table.track_ids[row] = track_id
+            table.popularity[row] = safe_number(track.get('popularity'))
+            table.duration_ms[row] = safe_number(track.get('duration_ms'))
+            table.explicit[row] = bool(track.get('explicit', False))
+
+            track_features = audio_features_map.get(track_id)
+            if track_features:
+                for i, key in enumerate(feature_keys):
+                    features[i, row] = safe_number(track_features.get(key))
+            row += 1
+
+        table.size = row
+        return table
+
+    def __len__(self) -> int:
+        return self.size
+
+    def feature_matrix(self) -> np.ndarray:
+        """(tracks x features) float32 view of the audio features"""
+        return self.features[:, :self.size].T
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Exportify-shaped DataFrame whose columns are views onto this table's arrays"""
+        n = self.size
+        columns = {
+            "Track Name": self.track_names[:n],
+            "Artist Name(s)": pd.Categorical.from_codes(self.artist_codes[:n], categories=self.artist_names),
+            "Album Name": pd.Categorical.from_codes(self.album_codes[:n], categories=self.album_names),
+            "Track ID": self.track_ids[:n],
+            "Popularity": self.popularity[:n],
+            "Duration (ms)": self.duration_ms[:n],
+            "Explicit": self.explicit[:n],
+        }
+        for i, (column, _) in enumerate(AUDIO_FEATURE_COLUMNS):
+            columns[column] = self.features[i, :n]
+        # Tuples as categories: tupleize_cols=False keeps them out of a MultiIndex
+        columns[ARTISTS_COLUMN] = pd.Categorical.from_codes(
+            self.artist_set_codes[:n], categories=pd.Index(self.artist_sets, dtype=object, tupleize_cols=False)
+        )
+        return pd.DataFrame(columns, columns=TRACK_COLUMNS, copy=False)